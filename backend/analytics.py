@@ -0,0 +1,294 @@
+from __future__ import annotations
+from typing import Dict, List, Optional
+
+from database import NetworkScanDB
+from targets import parse_network
+
+
+class HostAnalytics:
+    """
+    Availability and port flapping of known hosts, from per-host daily
+    aggregates that triggers on host_state update as each scan batch is saved.
+
+    Every host_state update is one check of the host. host_daily counts checks,
+    online checks, outages (online to offline) and port set changes per host and
+    day, and the seconds between two checks are added to the uptime of a host
+    that was online at the first of them. port_daily counts how often each port was
+    opened and closed. Reports over any window only sum daily rows.
+    """
+
+    def __init__(self, db: NetworkScanDB):
+        self.db = db
+        self.init_tables()
+
+    def init_tables(self):
+        with self.db.connections.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'host_daily'")
+            migrate = cursor.fetchone() is None
+
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS host_daily (
+                    ip_int INTEGER NOT NULL,
+                    day TEXT NOT NULL,
+                    checks INTEGER NOT NULL DEFAULT 0,
+                    online_checks INTEGER NOT NULL DEFAULT 0,
+                    outages INTEGER NOT NULL DEFAULT 0,
+                    port_changes INTEGER NOT NULL DEFAULT 0,
+                    up_seconds REAL NOT NULL DEFAULT 0,
+                    down_seconds REAL NOT NULL DEFAULT 0,
+                    PRIMARY KEY (ip_int, day)
+                ) WITHOUT ROWID
+            ''')
+
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS port_daily (
+                    ip_int INTEGER NOT NULL,
+                    port INTEGER NOT NULL,
+                    day TEXT NOT NULL,
+                    opened INTEGER NOT NULL DEFAULT 0,
+                    closed INTEGER NOT NULL DEFAULT 0,
+                    PRIMARY KEY (ip_int, port, day)
+                ) WITHOUT ROWID
+            ''')
+
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_port_daily_day
+                ON port_daily (day)
+            ''')
+
+            if migrate:
+                self._backfill(cursor)
+
+            cursor.execute('''
+                CREATE TRIGGER IF NOT EXISTS trg_host_state_insert AFTER INSERT ON host_state
+                BEGIN
+                    INSERT INTO host_daily (ip_int, day, checks, online_checks)
+                    VALUES (NEW.ip_int, date(NEW.last_checked), 1, NEW.status = 'online')
+                    ON CONFLICT (ip_int, day) DO UPDATE SET
+                        checks = checks + 1,
+                        online_checks = online_checks + excluded.online_checks;
+                END
+            ''')
+
+            # Offline updates keep open_ports, so OLD.open_ports are the ports of the last online check
+            cursor.execute('''
+                CREATE TRIGGER IF NOT EXISTS trg_host_state_update AFTER UPDATE ON host_state
+                BEGIN
+                    INSERT INTO host_daily (ip_int, day, checks, online_checks, outages, port_changes,
+                                            up_seconds, down_seconds)
+                    VALUES (NEW.ip_int, date(NEW.last_checked), 1, NEW.status = 'online',
+                            OLD.status = 'online' AND NEW.status = 'offline',
+                            NEW.status = 'online' AND NEW.open_ports IS NOT OLD.open_ports,
+                            CASE WHEN OLD.status = 'online'
+                                 THEN MAX(0, julianday(NEW.last_checked) - julianday(OLD.last_checked)) * 86400
+                                 ELSE 0 END,
+                            CASE WHEN OLD.status = 'offline'
+                                 THEN MAX(0, julianday(NEW.last_checked) - julianday(OLD.last_checked)) * 86400
+                                 ELSE 0 END)
+                    ON CONFLICT (ip_int, day) DO UPDATE SET
+                        checks = checks + 1,
+                        online_checks = online_checks + excluded.online_checks,
+                        outages = outages + excluded.outages,
+                        port_changes = port_changes + excluded.port_changes,
+                        up_seconds = up_seconds + excluded.up_seconds,
+                        down_seconds = down_seconds + excluded.down_seconds;
+
+                    INSERT INTO port_daily (ip_int, port, day, opened)
+                    SELECT NEW.ip_int, value, date(NEW.last_checked), 1
+                    FROM json_each(NEW.open_ports)
+                    WHERE NEW.status = 'online' AND value NOT IN (SELECT value FROM json_each(OLD.open_ports))
+                    ON CONFLICT (ip_int, port, day) DO UPDATE SET opened = opened + 1;
+
+                    INSERT INTO port_daily (ip_int, port, day, closed)
+                    SELECT NEW.ip_int, value, date(NEW.last_checked), 1
+                    FROM json_each(OLD.open_ports)
+                    WHERE NEW.status = 'online' AND value NOT IN (SELECT value FROM json_each(NEW.open_ports))
+                    ON CONFLICT (ip_int, port, day) DO UPDATE SET closed = closed + 1;
+                END
+            ''')
+
+    def _backfill(self, cursor):
+        """Aggregate the scan_results rows of known hosts, archived scans are not included"""
+        cursor.execute('''
+            WITH results AS (
+                SELECT sr.ip_int, s.scan_date AS checked, s.id AS scan_id, sr.status,
+                       SUM(sr.status = 'online') OVER (
+                           PARTITION BY sr.ip_int ORDER BY s.scan_date, s.id
+                       ) AS online_so_far
+                FROM scan_results sr
+                JOIN scans s ON sr.scan_id = s.id
+                WHERE sr.ip_int IN (SELECT ip_int FROM host_state)
+            ),
+            -- host_state, and so the triggers, only know a host from its first online check
+            checks AS (
+                SELECT ip_int, checked, status,
+                       LAG(status) OVER w AS previous_status,
+                       LAG(checked) OVER w AS previous_checked
+                FROM results
+                WHERE online_so_far > 0
+                WINDOW w AS (PARTITION BY ip_int ORDER BY checked, scan_id)
+            )
+            INSERT INTO host_daily (ip_int, day, checks, online_checks, outages, up_seconds, down_seconds)
+            SELECT ip_int, date(checked), COUNT(*), SUM(status = 'online'),
+                   SUM(previous_status = 'online' AND status = 'offline'),
+                   SUM(CASE WHEN previous_status = 'online'
+                            THEN (julianday(checked) - julianday(previous_checked)) * 86400 ELSE 0 END),
+                   SUM(CASE WHEN previous_status = 'offline'
+                            THEN (julianday(checked) - julianday(previous_checked)) * 86400 ELSE 0 END)
+            FROM checks
+            GROUP BY ip_int, date(checked)
+        ''')
+
+        cursor.execute('''
+            CREATE TEMP TABLE online_checks AS
+            SELECT sr.ip_int, date(s.scan_date) AS day, sr.open_ports,
+                   LAG(sr.open_ports) OVER (PARTITION BY sr.ip_int ORDER BY s.scan_date, s.id) AS previous_ports
+            FROM scan_results sr
+            JOIN scans s ON sr.scan_id = s.id
+            WHERE sr.status = 'online' AND sr.ip_int IN (SELECT ip_int FROM host_state)
+        ''')
+
+        cursor.execute('''
+            INSERT INTO host_daily (ip_int, day, port_changes)
+            SELECT ip_int, day, COUNT(*)
+            FROM temp.online_checks
+            WHERE previous_ports IS NOT NULL AND open_ports IS NOT previous_ports
+            GROUP BY ip_int, day
+            ON CONFLICT (ip_int, day) DO UPDATE SET port_changes = excluded.port_changes
+        ''')
+
+        cursor.execute('''
+            INSERT INTO port_daily (ip_int, port, day, opened, closed)
+            SELECT ip_int, port, day, SUM(opened), SUM(closed)
+            FROM (
+                SELECT c.ip_int, p.value AS port, c.day, 1 AS opened, 0 AS closed
+                FROM temp.online_checks c, json_each(c.open_ports) p
+                WHERE c.previous_ports IS NOT NULL
+                  AND p.value NOT IN (SELECT value FROM json_each(c.previous_ports))
+                UNION ALL
+                SELECT c.ip_int, p.value, c.day, 0, 1
+                FROM temp.online_checks c, json_each(c.previous_ports) p
+                WHERE p.value NOT IN (SELECT value FROM json_each(c.open_ports))
+            )
+            GROUP BY ip_int, port, day
+        ''')
+
+        cursor.execute('DROP TABLE temp.online_checks')
+
+    @staticmethod
+    def _bounds(network_range: Optional[str]):
+        if not network_range:
+            return 0, 2 ** 32 - 1
+        network = parse_network(network_range)
+        return int(network.network_address), int(network.broadcast_address)
+
+    def get_availability(self, days: float = 90, network_range: str = None) -> List[Dict]:
+        """
+        Availability of every known host (in network_range) over the last `days`,
+        in address order. Availability is the share of checks that found the
+        host online, so periods without scans don't count; mean time between
+        outages is its uptime divided by its outages.
+        """
+        key = ("availability", days, network_range)
+        return self.db.cache.get(key, lambda: self._load_availability(days, network_range))
+
+    def _load_availability(self, days: float, network_range: Optional[str]) -> List[Dict]:
+        first, last = self._bounds(network_range)
+        with self.db.connections.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT h.ip_address, h.hostname, h.status, d.checks, d.online_checks, d.outages,
+                       d.port_changes, d.up_seconds, d.down_seconds
+                FROM (
+                    SELECT ip_int, SUM(checks) AS checks, SUM(online_checks) AS online_checks,
+                           SUM(outages) AS outages, SUM(port_changes) AS port_changes,
+                           SUM(up_seconds) AS up_seconds, SUM(down_seconds) AS down_seconds
+                    FROM host_daily
+                    WHERE ip_int BETWEEN ? AND ? AND day >= date('now', ?)
+                    GROUP BY ip_int
+                ) d
+                JOIN host_state h ON h.ip_int = d.ip_int
+                ORDER BY d.ip_int
+            ''', (first, last, f"-{days} days"))
+
+            return [self._availability_entry(row) for row in cursor.fetchall()]
+
+    @staticmethod
+    def _availability_entry(row: tuple) -> Dict:
+        ip, hostname, status, checks, online_checks, outages, port_changes, up_seconds, down_seconds = row
+        availability = online_checks / checks if checks else 0
+        return {
+            "ip": ip,
+            "hostname": hostname or "Unknown",
+            "status": status,
+            "availability": round(availability * 100, 2),
+            "checks": checks,
+            "online_checks": online_checks,
+            "outages": outages,
+            "port_changes": port_changes,
+            "uptime_hours": round(up_seconds / 3600, 2),
+            "mtbo_hours": round(up_seconds / outages / 3600, 2) if outages else None
+        }
+
+    def get_host_uptime(self, ip_address: str, days: float = 90) -> List[Dict]:
+        """Daily availability of one host over the last `days`, oldest day first"""
+        with self.db.connections.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT h.ip_address, h.hostname, h.status, d.checks, d.online_checks, d.outages,
+                       d.port_changes, d.up_seconds, d.down_seconds, d.day
+                FROM host_daily d
+                JOIN host_state h ON h.ip_int = d.ip_int
+                WHERE h.ip_address = ? AND d.day >= date('now', ?)
+                ORDER BY d.day
+            ''', (ip_address, f"-{days} days"))
+
+            history = []
+            for row in cursor.fetchall():
+                entry = self._availability_entry(row[:-1])
+                entry["day"] = row[-1]
+                history.append(entry)
+            return history
+
+    def get_flapping_ports(self, days: float = 7, min_changes: int = 4, network_range: str = None) -> List[Dict]:
+        """Ports opened or closed at least min_changes times over the last `days`, most changes first"""
+        key = ("flapping_ports", days, min_changes, network_range)
+        return self.db.cache.get(key, lambda: self._load_flapping_ports(days, min_changes, network_range))
+
+    def _load_flapping_ports(self, days: float, min_changes: int, network_range: Optional[str]) -> List[Dict]:
+        first, last = self._bounds(network_range)
+        with self.db.connections.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT h.ip_address, h.hostname, p.port, p.opened, p.closed
+                FROM (
+                    SELECT ip_int, port, SUM(opened) AS opened, SUM(closed) AS closed
+                    FROM port_daily
+                    WHERE day >= date('now', ?) AND ip_int BETWEEN ? AND ?
+                    GROUP BY ip_int, port
+                    HAVING SUM(opened) + SUM(closed) >= ?
+                ) p
+                JOIN host_state h ON h.ip_int = p.ip_int
+                ORDER BY p.opened + p.closed DESC, p.ip_int, p.port
+            ''', (f"-{days} days", first, last, min_changes))
+
+            return [{
+                "ip": row[0],
+                "hostname": row[1] or "Unknown",
+                "port": row[2],
+                "opened": row[3],
+                "closed": row[4],
+                "changes": row[3] + row[4]
+            } for row in cursor.fetchall()]
+
+    def prune(self, days_to_keep: float) -> int:
+        """Drop daily aggregates older than days_to_keep, returns how many rows"""
+        with self.db.connections.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("DELETE FROM host_daily WHERE day < date('now', ?)", (f"-{days_to_keep} days",))
+            deleted = cursor.rowcount
+            cursor.execute("DELETE FROM port_daily WHERE day < date('now', ?)", (f"-{days_to_keep} days",))
+            if deleted or cursor.rowcount:
+                self.db._changed()
+            return deleted + cursor.rowcount
@@ -6,10 +6,14 @@ import threading
 import time
 import sys
 import os
+from contextlib import closing
 from datetime import datetime, timedelta
 
+from analytics import HostAnalytics
 from database import NetworkScanDB
 from main import NetworkScan
+from targets import int_to_ip, host_count
+from result_store import ScanResults
 from parser import Parser
 from version_checker import check_startup_version
 
@@ -39,38 +43,31 @@ socketio = SocketIO(
 )
 
 db = NetworkScanDB()
+analytics = HostAnalytics(db)
+
+# A scan still marked running at startup was cut off when its process died
+interrupted = db.fail_interrupted_scans()
+if interrupted:
+	print(f"Marked {interrupted} interrupted scans as failed")
 
 auto_scan_thread = None
 auto_scan_running = False
 next_auto_scan_time = None
 
 class WebsocketNetworkScan(NetworkScan):
-	def __init__(self):
-		super().__init__()
+	def __init__(self, db=None):
+		super().__init__(db)
 
-	def combined_scan_web(self, app, network_range=None, notes=None, is_auto_scan=False):
+	def combined_scan_web(self, app, network_range=None, notes=None, is_auto_scan=False, mode=None, incremental=None):
 		"""
 		Scan method for real-time updates via WebSocket
 		"""
 		from flask import current_app
 		import ipaddress
-		import subprocess
-		import platform
-		from concurrent.futures import ThreadPoolExecutor, as_completed
-		from socket import socket, AF_INET, SOCK_STREAM, gethostbyaddr, herror, gaierror, timeout
-
-		def get_hostname_from_ip(ip: str) -> str:
-			"""Resolve IP address to hostname"""
-			try:
-				hostname, _, _ = gethostbyaddr(ip)
-				return hostname
-			except (herror, gaierror, timeout):
-				return "Unknown"
-			except Exception:
-				return "Unknown"
 
 		with app.app_context():
 			results = {}
+			writer = None
 			start_time = time.time()
 
 			try:
@@ -89,159 +86,100 @@ class WebsocketNetworkScan(NetworkScan):
 					network_range = f"{current_ip}/{subnet}"
 
 				network = ipaddress.IPv4Network(network_range, strict=False)
-				host_ips = [str(ip) for ip in network.hosts()]
-
-				total_hosts = len(host_ips)
+				strategy, base_scan_id, known_hosts = self.plan_scan(network_range, incremental)
+				total_hosts = host_count(network) if known_hosts is None else len(known_hosts)
+				results = ScanResults(network)
+				writer = self.db.begin_scan(network_range, notes, strategy, base_scan_id,
+											results if self.liveness_bitmap else None)
 				socketio.emit('scan_progress', {
 					'phase': 'ping_sweep',
 					'message': f'Starting ping sweep of {total_hosts} hosts',
 					'progress': 0,
 					'total': total_hosts,
-					'scan_type': scan_type
+					'scan_type': scan_type,
+					'strategy': strategy,
+					'scan_id': writer.scan_id
 				})
 
-				online_hosts = []
 				completed = 0
-
-				def ping_host(ip_str):
-					nonlocal completed
-					try:
-						if platform.system().lower() == 'windows':
-							cmd = ['ping', '-n', '1', '-w', '2000', ip_str]
+				completed_ports = 0
+
+				with closing(self.scan_network(network, 2, mode, known_hosts)) as events:
+					for event in events:
+						ip = int_to_ip(event[1])
+						self.record_event(event, results, writer)
+						if event[0] == 'ping':
+							is_online = event[2]
+							completed += 1
+
+							socketio.emit('scan_progress', {
+								'phase': 'ping_sweep',
+								'message': f'Ping sweep: {completed}/{total_hosts}',
+								'progress': (completed + completed_ports) / (total_hosts + results.online_count) * 100,
+								'total': total_hosts,
+								'current_ip': ip,
+								'status': 'online' if is_online else 'offline',
+								'online_hosts': results.online_count,
+								'scan_type': scan_type
+							})
 						else:
-							cmd = ['ping', '-c', '1', '-W', '2', ip_str]
-
-						result = subprocess.run(
-							cmd,
-							capture_output=True,
-							text=True,
-							timeout=3,
-							encoding='utf-8',
-							errors='ignore'
-						)
-						is_online = result.returncode == 0
-
-						completed += 1
-						progress = (completed / total_hosts) * 40
-
-						socketio.emit('scan_progress', {
-							'phase': 'ping_sweep',
-							'message': f'Ping sweep: {completed}/{total_hosts}',
-							'progress': progress,
-							'total': total_hosts,
-							'current_ip': ip_str,
-							'status': 'online' if is_online else 'offline',
-							'scan_type': scan_type
-						})
-
-						return ip_str, is_online
-					except Exception as e:
-						completed += 1
-						print(f"Error pinging {ip_str}: {e}")
-						return ip_str, False
-
-				with ThreadPoolExecutor(max_workers=self.threads) as executor:
-					futures = [executor.submit(ping_host, ip) for ip in host_ips]
-
-					for future in as_completed(futures):
-						try:
-							ip, is_online = future.result()
-							if is_online:
-								online_hosts.append(ip)
-								results[ip] = {'status': 'online', 'ports': [], 'hostname': 'Unknown'}
-							else:
-								results[ip] = {'status': 'offline', 'ports': [], 'hostname': 'Unknown'}
-						except Exception:
-							continue
-
-				if online_hosts:
-					socketio.emit('scan_progress', {
-						'phase': 'port_scan',
-						'message': f'Starting port scan and hostname resolution of {len(online_hosts)} online hosts',
-						'progress': 40,
-						'total': len(online_hosts),
-						'online_hosts': len(online_hosts),
-						'scan_type': scan_type
-					})
-
-					completed_ports = 0
-
-					def scan_ports_and_hostname(ip):
-						nonlocal completed_ports
-						open_ports = []
-						for port in self.ports:
-							try:
-								s = socket(AF_INET, SOCK_STREAM)
-								s.settimeout(0.3)
-								connection = s.connect_ex((ip, port))
-								if connection == 0:
-									open_ports.append(port)
-								s.close()
-							except Exception:
-								continue
-							time.sleep(0.01)
-
-						hostname = get_hostname_from_ip(ip)
-
-						completed_ports += 1
-						progress = 40 + (completed_ports / len(online_hosts)) * 60
-
-						socketio.emit('scan_progress', {
-							'phase': 'port_scan',
-							'message': f'Port scan: {completed_ports}/{len(online_hosts)}',
-							'progress': progress,
-							'total': len(online_hosts),
-							'current_ip': ip,
-							'hostname': hostname,
-							'open_ports': open_ports,
-							'scan_type': scan_type
-						})
-
-						return ip, open_ports, hostname
-
-					with ThreadPoolExecutor(max_workers=self.threads) as executor:
-						futures = [executor.submit(scan_ports_and_hostname, ip) for ip in online_hosts]
-
-						for future in as_completed(futures):
-							try:
-								ip, open_ports, hostname = future.result()
-								results[ip]['ports'] = open_ports
-								results[ip]['hostname'] = hostname
-							except Exception as e:
-								print(f'Error scanning IP {ip}: {e}')
+							_, _, open_ports, hostname = event
+							completed_ports += 1
+
+							socketio.emit('scan_progress', {
+								'phase': 'port_scan',
+								'message': f'Port scan: {completed_ports}/{results.online_count}',
+								'progress': (completed + completed_ports) / (total_hosts + results.online_count) * 100,
+								'total': results.online_count,
+								'current_ip': ip,
+								'hostname': hostname,
+								'open_ports': open_ports,
+								'scan_type': scan_type
+							})
 
 				elapsed_time = time.time() - start_time
 
-				scan_id = self.db.save_scan_results(
-					results=results,
-					network_range=network_range,
-					scan_duration=elapsed_time,
-					notes=notes
-				)
+				carried_hosts = host_count(network) - len(results)
+				scan_id = writer.finish(elapsed_time, carried_hosts)
+				# The scan is saved, nothing below may mark it failed
+				writer = None
 
 				socketio.emit('scan_complete', {
 					'scan_id': scan_id,
-					'results': results,
+					'results': results.to_dict(),
 					'duration': elapsed_time,
 					'network_range': network_range,
 					'scan_type': scan_type,
+					'strategy': strategy,
 					'summary': {
-						'total_hosts': len(host_ips),
-						'online_hosts': len(online_hosts),
-						'hosts_with_ports': sum(1 for host in results.values() if len(host["ports"]) > 0)
+						'total_hosts': total_hosts,
+						'online_hosts': results.online_count,
+						'hosts_with_ports': results.hosts_with_ports,
+						'carried_hosts': carried_hosts,
+						'base_scan_id': base_scan_id
 					}
 				})
 
+				try:
+					previous_scan_id = self.db.get_previous_scan_id(network_range, scan_id)
+					if previous_scan_id is not None:
+						socketio.emit('scan_diff', self.db.diff_scans(previous_scan_id, scan_id))
+				except Exception as e:
+					print(f"Scan diff of scan {scan_id} failed: {e}")
+
 				return results
 
 			except Exception as e:
+				if writer is not None:
+					writer.fail()
 				socketio.emit('scan_error', {
 					'error': str(e),
 					'scan_type': scan_type
 				})
 				return results
 
-scanner = WebsocketNetworkScan()
+# Scans write through the handlers' db so their commits invalidate its query cache
+scanner = WebsocketNetworkScan(db)
 
 def auto_scan_worker():
 	"""Worker thread for automatic scanning"""
@@ -297,6 +235,33 @@ def stop_auto_scan():
 	auto_scan_running = False
 	print("Automatic scanning stopped")
 
+def retention_worker():
+	"""Worker thread that archives and deletes old scans"""
+	while True:
+		try:
+			archive_after_days = float(config.return_var("retention", "archive_after_days"))
+			delete_after_days = float(config.return_var("retention", "delete_after_days"))
+			chunk_rows = int(config.return_var("retention", "chunk_rows"))
+
+			if archive_after_days > 0:
+				archived = db.archive_old_scans(archive_after_days, chunk_rows)
+				if archived:
+					print(f"Archived {archived} scans older than {archive_after_days:g} days")
+			if delete_after_days > 0:
+				deleted = db.delete_old_scans(delete_after_days)
+				if deleted:
+					print(f"Deleted {deleted} scans older than {delete_after_days:g} days")
+
+			keep_days = float(config.return_var("analytics", "keep_days"))
+			if keep_days > 0:
+				analytics.prune(keep_days)
+
+			time.sleep(int(config.return_var("retention", "interval_minutes")) * 60)
+
+		except Exception as e:
+			print(f"Error in retention worker: {e}")
+			time.sleep(60)
+
 @app.route('/')
 def health_check():
 	return {
@@ -305,7 +270,9 @@ def health_check():
 		'version': '1.0.0',
 		'auto_scan_enabled': config.return_var("auto_scan", "enabled").lower() == "true",
 		'auto_scan_running': auto_scan_running,
-		'next_auto_scan': next_auto_scan_time.isoformat() if next_auto_scan_time else None
+		'next_auto_scan': next_auto_scan_time.isoformat() if next_auto_scan_time else None,
+		'query_cache': db.cache.stats(),
+		'resolver_cache': scanner.resolver.stats()
 	}
 
 @app.route('/health')
@@ -333,23 +300,98 @@ def handle_disconnect():
 def handle_start_scan(data):
 	network_range = data.get('network_range', None)
 	notes = data.get('notes', 'Manual WebSocket Scan')
+	mode = data.get('mode', None)
+	incremental = data.get('incremental', None)
 
 	socketio.start_background_task(target=scanner.combined_scan_web,
 								   app=app,
 								   network_range=network_range,
 								   notes=notes,
-								   is_auto_scan=False)
+								   is_auto_scan=False,
+								   mode=mode,
+								   incremental=incremental)
 
 @socketio.on('get_scan_history')
 def handle_get_scan_history():
 	history = db.get_scan_history()
 	emit('scan_history', history)
 
+@socketio.on('get_scan_history_page')
+def handle_get_scan_history_page(data=None):
+	data = data or {}
+	page = db.get_scan_history_page(int(data.get('limit', 10)), data.get('cursor'))
+	emit('scan_history_page', page)
+
+@socketio.on('get_scan_results_page')
+def handle_get_scan_results_page(data):
+	page = db.get_scan_results_page(int(data['scan_id']), data.get('cursor'), int(data.get('limit', 500)))
+	emit('scan_results_page', page)
+
+@socketio.on('get_host_history_page')
+def handle_get_host_history_page(data):
+	page = db.get_host_history_page(data['ip_address'], int(data.get('limit', 10)), data.get('cursor'))
+	page['ip_address'] = data['ip_address']
+	emit('host_history_page', page)
+
+@socketio.on('get_hosts_history')
+def handle_get_hosts_history(data):
+	"""History of many hosts at once, given as a list of IPs or a CIDR range"""
+	history = db.get_hosts_history(data.get('ip_addresses'), data.get('network_range'),
+								   int(data.get('limit', 10)))
+	emit('hosts_history', {
+		'network_range': data.get('network_range'),
+		'hosts': history
+	})
+
+@socketio.on('get_scan_diff')
+def handle_get_scan_diff(data):
+	"""Diff two scans, or a scan against the current state when scan_id is omitted"""
+	scan_id = data.get('scan_id')
+	diff = db.diff_scans(int(data['base_scan_id']), int(scan_id) if scan_id is not None else None)
+	emit('scan_diff', diff)
+
+@socketio.on('get_host_analytics')
+def handle_get_host_analytics(data=None):
+	"""Availability of every known host and flapping ports, optionally within a CIDR range"""
+	data = data or {}
+	network_range = data.get('network_range')
+	availability_days = float(data.get('days', config.return_var("analytics", "availability_days")))
+	flapping_days = float(data.get('flapping_days', config.return_var("analytics", "flapping_days")))
+	flapping_changes = int(data.get('flapping_changes', config.return_var("analytics", "flapping_changes")))
+
+	emit('host_analytics', {
+		'network_range': network_range,
+		'days': availability_days,
+		'availability': analytics.get_availability(availability_days, network_range),
+		'flapping_ports': analytics.get_flapping_ports(flapping_days, flapping_changes, network_range)
+	})
+
+@socketio.on('get_host_uptime')
+def handle_get_host_uptime(data):
+	days = float(data.get('days', config.return_var("analytics", "availability_days")))
+	emit('host_uptime', {
+		'ip_address': data['ip_address'],
+		'days': analytics.get_host_uptime(data['ip_address'], days)
+	})
+
 @socketio.on('get_statistics')
 def handle_get_statistics():
 	stats = db.get_statistics()
 	emit('statistics', stats)
 
+@socketio.on('get_cache_stats')
+def handle_get_cache_stats():
+	emit('cache_stats', db.cache.stats())
+
+@socketio.on('get_resolver_stats')
+def handle_get_resolver_stats():
+	emit('resolver_stats', scanner.resolver.stats())
+
+@socketio.on('get_host_inventory')
+def handle_get_host_inventory():
+	inventory = db.get_host_inventory()
+	emit('host_inventory', inventory)
+
 @socketio.on('get_auto_scan_status')
 def handle_get_auto_scan_status():
 	emit('auto_scan_status', {
@@ -408,6 +450,7 @@ if __name__ == "__main__":
 		sys.exit(1)
 
 	start_auto_scan()
+	threading.Thread(target=retention_worker, daemon=True).start()
 
 	print(r"""
    _____ _____ _____ ____  _   _ 
@@ -0,0 +1,100 @@
+"""
+Benchmark of dashboard reads while a large scan is being saved: a fresh
+rollback-journal connection per call versus the pooled WAL connections.
+
+Usage: python benchmark_db.py [network_range] [readers]
+Defaults to a /16 (65534 hosts) and 4 reader threads. Uses temporary databases.
+"""
+import ipaddress
+import os
+import sqlite3
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+from database import NetworkScanDB
+from db_connection import ConnectionManager
+from query_cache import QueryCache
+
+
+class PerCallConnections(ConnectionManager):
+    """A new connection per call in rollback-journal mode, as NetworkScanDB used to do"""
+
+    def __init__(self, db_path: str):
+        super().__init__(db_path, pragmas={"journal_mode": "DELETE"})
+
+    def connection(self):
+        return sqlite3.connect(self.db_path)
+
+
+def fake_results(network: ipaddress.IPv4Network) -> dict:
+    results = {}
+    for index, ip in enumerate(network.hosts()):
+        online = index % 20 == 0
+        results[str(ip)] = {
+            "status": "online" if online else "offline",
+            "ports": [22, 80, 443] if online else [],
+            "hostname": f"host-{index}.lan" if online else "Unknown"
+        }
+    return results
+
+
+def reader(db: NetworkScanDB, stop: threading.Event, latencies: list, errors: list):
+    while not stop.is_set():
+        start = time.perf_counter()
+        try:
+            db.get_scan_history()
+            db.get_statistics()
+        except sqlite3.OperationalError as e:
+            errors.append(e)
+            continue
+        latencies.append(time.perf_counter() - start)
+
+
+def run(label: str, db: NetworkScanDB, results: dict, readers: int):
+    db.save_scan_results(results, "seed", 0)
+
+    stop = threading.Event()
+    latencies = []
+    errors = []
+    threads = [threading.Thread(target=reader, args=(db, stop, latencies, errors)) for _ in range(readers)]
+    for thread in threads:
+        thread.start()
+
+    start = time.perf_counter()
+    db.save_scan_results(results, "benchmark", 0)
+    write_time = time.perf_counter() - start
+
+    stop.set()
+    for thread in threads:
+        thread.join()
+
+    if latencies:
+        latencies.sort()
+        p50 = statistics.median(latencies) * 1000
+        p99 = latencies[int(len(latencies) * 0.99)] * 1000
+        worst = latencies[-1] * 1000
+        print(f"{label:<26} save {write_time:7.2f}s  reads {len(latencies):>6}  "
+              f"p50 {p50:8.2f}ms  p99 {p99:8.2f}ms  max {worst:8.2f}ms  errors {len(errors)}")
+    else:
+        print(f"{label:<26} save {write_time:7.2f}s  no read completed, errors {len(errors)}")
+
+
+if __name__ == "__main__":
+    network_range = sys.argv[1] if len(sys.argv) > 1 else "10.0.0.0/16"
+    readers = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+
+    results = fake_results(ipaddress.IPv4Network(network_range, strict=False))
+    print(f"Saving a scan of {len(results)} hosts with {readers} concurrent readers")
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "per_call.db")
+        # Both run without the query cache so every read reaches SQLite
+        run("per-call connection", NetworkScanDB(path, PerCallConnections(path), QueryCache(0)), results, readers)
+
+        path = os.path.join(directory, "pooled.db")
+        db = NetworkScanDB(path, cache=QueryCache(0))
+        run("pooled WAL connections", db, results, readers)
+        db.connections.close()
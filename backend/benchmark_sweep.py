@@ -0,0 +1,63 @@
+"""
+Benchmark of the ping sweep: one ping process per host versus the shared ICMP socket.
+
+Usage: python benchmark_sweep.py [network_range] [threads]
+Defaults to 127.0.0.0/24, where every address answers on Linux.
+"""
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import ipaddress
+import shutil
+import subprocess
+import sys
+import time
+
+from icmp_sweep import IcmpSweep
+from targets import ip_to_int
+
+
+def subprocess_sweep(host_ips: list, threads: int, ping_timeout: int = 2) -> int:
+    def ping(ip: str) -> bool:
+        result = subprocess.run(
+            ['ping', '-c', '1', '-W', str(ping_timeout), ip],
+            capture_output=True,
+            timeout=ping_timeout + 1
+        )
+        return result.returncode == 0
+
+    online = 0
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        futures = [executor.submit(ping, ip) for ip in host_ips]
+        for future in as_completed(futures):
+            if future.result():
+                online += 1
+    return online
+
+
+def socket_sweep(host_ips: list, ping_timeout: int = 2) -> int:
+    with IcmpSweep(timeout=ping_timeout) as sweeper:
+        return sum(1 for _, is_online, _ in sweeper.sweep(map(ip_to_int, host_ips)) if is_online)
+
+
+def run(label: str, func, *args):
+    start = time.perf_counter()
+    online = func(*args)
+    elapsed = time.perf_counter() - start
+    print(f"{label:<22} {online:>6} online  {elapsed:8.3f}s  {len(args[0]) / elapsed:10.0f} hosts/s")
+
+
+if __name__ == "__main__":
+    network_range = sys.argv[1] if len(sys.argv) > 1 else "127.0.0.0/24"
+    threads = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+
+    host_ips = [str(ip) for ip in ipaddress.IPv4Network(network_range, strict=False).hosts()]
+    print(f"Sweeping {len(host_ips)} hosts in {network_range}")
+
+    try:
+        run("shared ICMP socket", socket_sweep, host_ips)
+    except OSError as e:
+        print(f"shared ICMP socket     unavailable: {e}")
+
+    if shutil.which("ping"):
+        run(f"ping x{threads} threads", subprocess_sweep, host_ips, threads)
+    else:
+        print("ping subprocess        unavailable: no ping binary on PATH")
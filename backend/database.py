@@ -1,21 +1,37 @@
-import sqlite3
+from __future__ import annotations
+from bisect import bisect_left, bisect_right
+from heapq import merge
+from itertools import islice
 import json
 import os
+import time
+import zlib
 from datetime import datetime
-from typing import Dict, List, Optional
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from db_connection import ConnectionManager
+from query_cache import QueryCache
+from result_store import ScanResults, bit_is_set, iter_set_bits
+from targets import int_to_ip, ip_to_int, parse_network
 
 
 class NetworkScanDB:
-    def __init__(self, db_path: str = None):
+    def __init__(self, db_path: str = None, connections: ConnectionManager = None, cache: QueryCache = None):
         if db_path is None:
             base_dir = os.path.dirname(os.path.abspath(__file__))
             self.db_path = os.path.join(base_dir, "network_scans.db")
         else:
             self.db_path = db_path
+        self.connections = connections or ConnectionManager(self.db_path)
+        self.cache = cache or QueryCache()
         self.init_database()
 
+    def _changed(self):
+        """Drop cached query results once the current transaction commits"""
+        self.connections.after_commit(self.cache.invalidate)
+
     def init_database(self):
-        with sqlite3.connect(self.db_path) as conn:
+        with self.connections.connection() as conn:
             cursor = conn.cursor()
 
             cursor.execute('''
@@ -26,7 +42,11 @@ class NetworkScanDB:
                     total_hosts INTEGER,
                     online_hosts INTEGER,
                     scan_duration REAL,
-                    notes TEXT
+                    notes TEXT,
+                    scan_strategy TEXT DEFAULT 'full',
+                    base_scan_id INTEGER,
+                    carried_hosts INTEGER DEFAULT 0,
+                    status TEXT DEFAULT 'complete'  -- running, complete or failed
                 )
             ''')
 
@@ -39,6 +59,7 @@ class NetworkScanDB:
                     status TEXT NOT NULL,
                     open_ports TEXT,  -- JSON string of port list
                     scan_timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    ip_int INTEGER,
                     FOREIGN KEY (scan_id) REFERENCES scans (id)
                 )
             ''')
@@ -47,163 +68,807 @@ class NetworkScanDB:
             columns = [column[1] for column in cursor.fetchall()]
             if 'hostname' not in columns:
                 cursor.execute('ALTER TABLE scan_results ADD COLUMN hostname TEXT')
+            if 'ip_int' not in columns:
+                cursor.execute('ALTER TABLE scan_results ADD COLUMN ip_int INTEGER')
+                conn.create_function("ip_to_int", 1, ip_to_int, deterministic=True)
+                cursor.execute('UPDATE scan_results SET ip_int = ip_to_int(ip_address)')
+
+            cursor.execute("PRAGMA table_info(scans)")
+            columns = [column[1] for column in cursor.fetchall()]
+            if 'scan_strategy' not in columns:
+                cursor.execute("ALTER TABLE scans ADD COLUMN scan_strategy TEXT DEFAULT 'full'")
+            if 'base_scan_id' not in columns:
+                cursor.execute('ALTER TABLE scans ADD COLUMN base_scan_id INTEGER')
+            if 'carried_hosts' not in columns:
+                cursor.execute('ALTER TABLE scans ADD COLUMN carried_hosts INTEGER DEFAULT 0')
+            if 'status' not in columns:
+                cursor.execute("ALTER TABLE scans ADD COLUMN status TEXT DEFAULT 'complete'")
 
             cursor.execute('''
                 CREATE INDEX IF NOT EXISTS idx_scan_results_ip 
                 ON scan_results (ip_address)
             ''')
 
+            # Results of a scan are paged in address order, which also covers lookups by scan_id
+            cursor.execute('DROP INDEX IF EXISTS idx_scan_results_scan_id')
             cursor.execute('''
-                CREATE INDEX IF NOT EXISTS idx_scan_results_scan_id 
-                ON scan_results (scan_id)
+                CREATE INDEX IF NOT EXISTS idx_scan_results_scan_ip
+                ON scan_results (scan_id, ip_int)
             ''')
 
-            conn.commit()
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_scans_date
+                ON scans (scan_date, id)
+            ''')
 
-    def save_scan_results(self, results: Dict, network_range: str = None,
-                          scan_duration: float = 0, notes: str = None) -> int:
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_scan_results_ip_int
+                ON scan_results (ip_int, scan_id)
+            ''')
 
-            total_hosts = len(results)
-            online_hosts = sum(1 for host in results.values() if host["status"] == "online")
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'scan_ports'")
+            migrate_ports = cursor.fetchone() is None
 
             cursor.execute('''
-                INSERT INTO scans (network_range, total_hosts, online_hosts, scan_duration, notes)
-                VALUES (?, ?, ?, ?, ?)
-            ''', (network_range, total_hosts, online_hosts, scan_duration, notes))
+                CREATE TABLE IF NOT EXISTS scan_ports (
+                    scan_id INTEGER NOT NULL,
+                    ip_address TEXT NOT NULL,
+                    port INTEGER NOT NULL,
+                    ip_int INTEGER,
+                    PRIMARY KEY (scan_id, ip_address, port)
+                ) WITHOUT ROWID
+            ''')
 
-            scan_id = cursor.lastrowid
+            cursor.execute("PRAGMA table_info(scan_ports)")
+            if 'ip_int' not in [column[1] for column in cursor.fetchall()]:
+                cursor.execute('ALTER TABLE scan_ports ADD COLUMN ip_int INTEGER')
+                conn.create_function("ip_to_int", 1, ip_to_int, deterministic=True)
+                cursor.execute('UPDATE scan_ports SET ip_int = ip_to_int(ip_address)')
+                cursor.execute('DROP INDEX IF EXISTS idx_scan_ports_port')
 
-            for ip, data in results.items():
-                ports_json = json.dumps(data["ports"]) if data["ports"] else "[]"
-                hostname = data.get("hostname", "Unknown")
+            # Hosts with a port open in a scan are read in address order
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_scan_ports_port_ip
+                ON scan_ports (port, scan_id, ip_int)
+            ''')
+
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'host_state'")
+            migrate_state = cursor.fetchone() is None
+
+            # Latest known state of every host ever seen online, kept up to date by ScanResultWriter
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS host_state (
+                    ip_int INTEGER PRIMARY KEY,
+                    ip_address TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    open_ports TEXT,  -- JSON string of port list
+                    hostname TEXT,
+                    first_seen TIMESTAMP,  -- first and last time seen online
+                    last_seen TIMESTAMP,
+                    last_checked TIMESTAMP,
+                    last_scan_id INTEGER
+                )
+            ''')
+
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_host_state_status
+                ON host_state (status, ip_int)
+            ''')
+
+            if migrate_state:
+                cursor.execute('''
+                    INSERT INTO host_state (ip_int, ip_address, status, open_ports, hostname,
+                                            first_seen, last_seen, last_checked, last_scan_id)
+                    SELECT latest.ip_int, latest.ip_address, latest.status, latest.open_ports, latest.hostname,
+                           online.first_seen, online.last_seen, s.scan_date, latest.scan_id
+                    FROM (
+                        SELECT sr.ip_int, MIN(s.scan_date) AS first_seen, MAX(s.scan_date) AS last_seen
+                        FROM scan_results sr
+                        JOIN scans s ON sr.scan_id = s.id
+                        WHERE sr.status = 'online'
+                        GROUP BY sr.ip_int
+                    ) online
+                    JOIN scan_results latest ON latest.id = (
+                        SELECT MAX(id) FROM scan_results WHERE ip_int = online.ip_int
+                    )
+                    JOIN scans s ON latest.scan_id = s.id
+                ''')
+
+            if migrate_ports:
                 cursor.execute('''
-                    INSERT INTO scan_results (scan_id, ip_address, hostname, status, open_ports)
-                    VALUES (?, ?, ?, ?, ?)
-                ''', (scan_id, ip, hostname, data["status"], ports_json))
+                    INSERT OR IGNORE INTO scan_ports (scan_id, ip_address, port, ip_int)
+                    SELECT sr.scan_id, sr.ip_address, CAST(port.value AS INTEGER), sr.ip_int
+                    FROM scan_results sr, json_each(sr.open_ports) port
+                    WHERE sr.open_ports IS NOT NULL AND sr.open_ports NOT IN ('', '[]')
+                ''')
+
+            # Liveness of scans saved with a bitmap: only their online hosts have scan_results rows
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS scan_liveness (
+                    scan_id INTEGER PRIMARY KEY,
+                    first_ip INTEGER NOT NULL,
+                    size INTEGER NOT NULL,
+                    probed BLOB NOT NULL,  -- zlib compressed bitmaps, bit i is host first_ip + i
+                    online BLOB NOT NULL,
+                    offline_hosts INTEGER NOT NULL DEFAULT 0  -- probed but offline, counted in scanned_ips
+                )
+            ''')
+
+            # Result rows of archived scans, the scans row stays as their summary
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS scan_archives (
+                    scan_id INTEGER PRIMARY KEY,
+                    results BLOB NOT NULL,  -- zlib compressed JSON list of scan_results rows
+                    archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    first_ip INTEGER,  -- lowest and highest ip_int of the rows
+                    last_ip INTEGER
+                )
+            ''')
+
+            cursor.execute("PRAGMA table_info(scan_archives)")
+            if 'first_ip' not in [column[1] for column in cursor.fetchall()]:
+                self._migrate_archives(cursor)
+
+            self._init_statistics(cursor)
 
             conn.commit()
-            return scan_id
 
-    def get_scan_history(self, limit: int = 10) -> List[Dict]:
-        with sqlite3.connect(self.db_path) as conn:
+    def _init_statistics(self, cursor):
+        """
+        Aggregates for get_statistics, kept up to date by triggers so reading them
+        costs the same however large the history grows. Scan totals cover complete
+        scans only. scanned_ips counts the results of every IP, scan_results rows and
+        offline bits of liveness bitmaps alike, so unique IPs stay exact when scans are
+        deleted and don't depend on how results are stored.
+        """
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'scan_statistics'")
+        migrate = cursor.fetchone() is None
+
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS scan_statistics (
+                id INTEGER PRIMARY KEY CHECK (id = 1),
+                total_scans INTEGER NOT NULL DEFAULT 0,
+                online_hosts_sum INTEGER NOT NULL DEFAULT 0,
+                unique_ips INTEGER NOT NULL DEFAULT 0
+            )
+        ''')
+
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS scanned_ips (
+                ip_address TEXT PRIMARY KEY,
+                results INTEGER NOT NULL
+            ) WITHOUT ROWID
+        ''')
+
+        if migrate:
+            cursor.execute('''
+                INSERT OR IGNORE INTO scanned_ips (ip_address, results)
+                SELECT ip_address, COUNT(*) FROM scan_results GROUP BY ip_address
+            ''')
+            cursor.execute('''
+                INSERT INTO scan_statistics (id, total_scans, online_hosts_sum, unique_ips)
+                SELECT 1, 0, 0, (SELECT COUNT(*) FROM scanned_ips)
+            ''')
+
+        # Only complete scans count, like before scans were saved while running.
+        # Replaces trg_scans_insert/update/delete, which counted every scan
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'trigger' AND name = 'trg_scans_insert'")
+        if cursor.fetchone() or migrate:
+            for name in ("trg_scans_insert", "trg_scans_update", "trg_scans_delete"):
+                cursor.execute(f'DROP TRIGGER IF EXISTS {name}')
+            cursor.execute('''
+                UPDATE scan_statistics
+                SET total_scans = (SELECT COUNT(*) FROM scans WHERE status = 'complete'),
+                    online_hosts_sum = (SELECT COALESCE(SUM(online_hosts), 0) FROM scans WHERE status = 'complete')
+            ''')
+
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_complete_scans_insert AFTER INSERT ON scans
+            WHEN NEW.status = 'complete'
+            BEGIN
+                UPDATE scan_statistics
+                SET total_scans = total_scans + 1,
+                    online_hosts_sum = online_hosts_sum + COALESCE(NEW.online_hosts, 0);
+            END
+        ''')
+
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_complete_scans_update AFTER UPDATE OF online_hosts, status ON scans
+            WHEN NEW.status = 'complete' OR OLD.status = 'complete'
+            BEGIN
+                UPDATE scan_statistics
+                SET total_scans = total_scans + (NEW.status = 'complete') - (OLD.status = 'complete'),
+                    online_hosts_sum = online_hosts_sum
+                        + CASE WHEN NEW.status = 'complete' THEN COALESCE(NEW.online_hosts, 0) ELSE 0 END
+                        - CASE WHEN OLD.status = 'complete' THEN COALESCE(OLD.online_hosts, 0) ELSE 0 END;
+            END
+        ''')
+
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_complete_scans_delete AFTER DELETE ON scans
+            WHEN OLD.status = 'complete'
+            BEGIN
+                UPDATE scan_statistics
+                SET total_scans = total_scans - 1,
+                    online_hosts_sum = online_hosts_sum - COALESCE(OLD.online_hosts, 0);
+            END
+        ''')
+
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_scan_results_insert AFTER INSERT ON scan_results
+            BEGIN
+                INSERT INTO scanned_ips (ip_address, results) VALUES (NEW.ip_address, 1)
+                ON CONFLICT (ip_address) DO UPDATE SET results = results + 1;
+            END
+        ''')
+
+        # Rows deleted by archival still count, delete_old_scans releases them from the archive.
+        # Replaces trg_scan_results_delete, which released every deleted row
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'trigger' AND name = 'trg_scan_results_delete'")
+        if cursor.fetchone():
+            cursor.execute('DROP TRIGGER trg_scan_results_delete')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_scan_results_delete_live AFTER DELETE ON scan_results
+            WHEN NOT EXISTS (SELECT 1 FROM scan_archives WHERE scan_id = OLD.scan_id)
+            BEGIN
+                UPDATE scanned_ips SET results = results - 1 WHERE ip_address = OLD.ip_address;
+                DELETE FROM scanned_ips WHERE ip_address = OLD.ip_address AND results <= 0;
+            END
+        ''')
+
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_scanned_ips_insert AFTER INSERT ON scanned_ips
+            BEGIN
+                UPDATE scan_statistics SET unique_ips = unique_ips + 1;
+            END
+        ''')
+
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_scanned_ips_delete AFTER DELETE ON scanned_ips
+            BEGIN
+                UPDATE scan_statistics SET unique_ips = unique_ips - 1;
+            END
+        ''')
+
+        # Offline hosts of liveness bitmaps scans saved before they were counted
+        cursor.execute("PRAGMA table_info(scan_liveness)")
+        if 'offline_hosts' not in [column[1] for column in cursor.fetchall()]:
+            cursor.execute('ALTER TABLE scan_liveness ADD COLUMN offline_hosts INTEGER NOT NULL DEFAULT 0')
+            cursor.execute('SELECT scan_id, first_ip, probed, online FROM scan_liveness')
+            for scan_id, first_ip, probed, online in cursor.fetchall():
+                ips = self._offline_ips(first_ip, zlib.decompress(probed), zlib.decompress(online))
+                self._count_scanned_ips(cursor, ips, 1)
+                cursor.execute('UPDATE scan_liveness SET offline_hosts = ? WHERE scan_id = ?', (len(ips), scan_id))
+
+    @staticmethod
+    def _offline_ips(first_ip: int, probed: bytes, online: bytes) -> List[str]:
+        """IPs probed but offline in a pair of liveness bitmaps"""
+        offline = bytes(p & ~o for p, o in zip(probed, online))
+        return [int_to_ip(ip) for ip in iter_set_bits(offline, first_ip)]
+
+    @staticmethod
+    def _count_scanned_ips(cursor, ips: List[str], delta: int):
+        """Add delta results to each IP of scanned_ips, dropping IPs left without results"""
+        if delta > 0:
+            cursor.executemany('''
+                INSERT INTO scanned_ips (ip_address, results) VALUES (?, ?)
+                ON CONFLICT (ip_address) DO UPDATE SET results = results + excluded.results
+            ''', ((ip, delta) for ip in ips))
+        else:
+            cursor.executemany('UPDATE scanned_ips SET results = results + ? WHERE ip_address = ?',
+                               ((delta, ip) for ip in ips))
+            cursor.execute('DELETE FROM scanned_ips WHERE results <= 0')
+
+    def save_scan_results(self, results: Dict, network_range: str = None,
+                          scan_duration: float = 0, notes: str = None, scan_strategy: str = "full",
+                          base_scan_id: int = None, carried_hosts: int = 0) -> int:
+        """
+        Save the hosts probed by a finished scan. An incremental scan records the
+        full sweep its unprobed hosts are carried forward from and how many there are.
+        """
+        writer = self.begin_scan(network_range, notes, scan_strategy, base_scan_id)
+        for ip, data in results.items():
+            writer.add(ip, data["status"], data["ports"], data.get("hostname", "Unknown"))
+        return writer.finish(scan_duration, carried_hosts)
+
+    def begin_scan(self, network_range: str = None, notes: str = None, scan_strategy: str = "full",
+                   base_scan_id: int = None, liveness: ScanResults = None) -> ScanResultWriter:
+        """
+        Create the scans row of a starting scan and return a writer for its results.
+        With `liveness`, the results the scan fills in, offline hosts are stored as
+        its bitmaps instead of one row each.
+        """
+        with self.connections.connection() as conn:
             cursor = conn.cursor()
             cursor.execute('''
+                INSERT INTO scans (network_range, total_hosts, online_hosts, scan_duration, notes,
+                                   scan_strategy, base_scan_id, carried_hosts, status)
+                VALUES (?, 0, 0, 0, ?, ?, ?, 0, 'running')
+            ''', (network_range, notes, scan_strategy, base_scan_id))
+            self._changed()
+
+            return ScanResultWriter(self, cursor.lastrowid, liveness=liveness)
+
+    def fail_interrupted_scans(self) -> int:
+        """Mark the scans left running by a process that died as failed, returns how many"""
+        with self.connections.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("UPDATE scans SET status = 'failed' WHERE status = 'running'")
+            if cursor.rowcount:
+                self._changed()
+            return cursor.rowcount
+
+    @staticmethod
+    def _scan_entry(row: tuple) -> Dict:
+        return {
+            "scan_id": row[0],
+            "scan_date": row[1],
+            "network_range": row[2],
+            "total_hosts": row[3],
+            "online_hosts": row[4],
+            "scan_duration": row[5],
+            "notes": row[6],
+            "scan_strategy": row[7] or "full",
+            "base_scan_id": row[8],
+            "carried_hosts": row[9] or 0,
+            "archived": bool(row[10]),
+            "status": row[11] or "complete"
+        }
+
+    def get_scan_history(self, limit: int = 10) -> List[Dict]:
+        return self.get_scan_history_page(limit)["scans"]
+
+    def get_scan_history_page(self, limit: int = 10, cursor: Optional[List] = None) -> Dict:
+        """
+        One page of scans, newest first. Pass the returned next_cursor, a
+        [scan_date, scan_id] pair, to get the following page; it is None on the last page.
+        """
+        key = ("scan_history", limit, tuple(cursor) if cursor else None)
+        return self.cache.get(key, lambda: self._load_scan_history_page(limit, cursor))
+
+    def _load_scan_history_page(self, limit: int, cursor: Optional[List]) -> Dict:
+        before_date, before_id = cursor if cursor else (None, None)
+        with self.connections.connection() as conn:
+            db_cursor = conn.cursor()
+            db_cursor.execute('''
                 SELECT id, scan_date, network_range, total_hosts, online_hosts, 
-                       scan_duration, notes
+                       scan_duration, notes, scan_strategy, base_scan_id, carried_hosts,
+                       EXISTS (SELECT 1 FROM scan_archives WHERE scan_id = scans.id), status
                 FROM scans 
-                ORDER BY scan_date DESC 
+                WHERE ? IS NULL OR (scan_date, id) < (?, ?)
+                ORDER BY scan_date DESC, id DESC
                 LIMIT ?
-            ''', (limit,))
-
-            scans = []
-            for row in cursor.fetchall():
-                scans.append({
-                    "scan_id": row[0],
-                    "scan_date": row[1],
-                    "network_range": row[2],
-                    "total_hosts": row[3],
-                    "online_hosts": row[4],
-                    "scan_duration": row[5],
-                    "notes": row[6]
-                })
+            ''', (before_date, before_date, before_id, limit))
 
-            return scans
+            scans = [self._scan_entry(row) for row in db_cursor.fetchall()]
+            next_cursor = [scans[-1]["scan_date"], scans[-1]["scan_id"]] if len(scans) == limit else None
+            return {"scans": scans, "next_cursor": next_cursor}
 
-    def get_scan_results(self, scan_id: int) -> Dict:
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
+    @staticmethod
+    def _result_entry(row: tuple) -> Dict:
+        _, _, hostname, status, ports_json, timestamp = row
+        return {
+            "status": status,
+            "ports": json.loads(ports_json) if ports_json else [],
+            "hostname": hostname or "Unknown",
+            "timestamp": timestamp
+        }
 
-            cursor.execute('''
-                SELECT scan_date, network_range, total_hosts, online_hosts, 
-                       scan_duration, notes
-                FROM scans 
-                WHERE id = ?
-            ''', (scan_id,))
+    def _iter_result_rows(self, cursor, scan_id: int, scan_date: str, after: int = -1,
+                          batch_size: int = 1000) -> Iterator[tuple]:
+        """
+        (ip_int, ip, hostname, status, ports_json, timestamp) rows of a scan with
+        ip_int > after, in address order, read in keyset pages of batch_size rows.
+        Offline hosts of scans saved with liveness bitmaps are merged in.
+        """
+        rows = self._get_archived_rows(cursor, scan_id)
+        if rows is not None:
+            rows = (row for row in rows if row[0] > after)
+        else:
+            rows = self._iter_stored_rows(cursor, scan_id, after, batch_size)
 
-            scan_info = cursor.fetchone()
-            if not scan_info:
-                return {}
+        liveness = self._get_liveness(cursor, scan_id)
+        if liveness is not None:
+            first_ip, probed, online = liveness
+            start = max(0, after - first_ip + 1) >> 3
+            offline = ((ip, int_to_ip(ip), "Unknown", "offline", "[]", scan_date)
+                       for ip in iter_set_bits(probed[start:], first_ip + (start << 3))
+                       if ip > after and not bit_is_set(online, ip - first_ip))
+            rows = merge(rows, offline, key=lambda row: row[0])
 
+        return rows
+
+    def _iter_stored_rows(self, cursor, scan_id: int, after: int, batch_size: int) -> Iterator[tuple]:
+        while True:
             cursor.execute('''
-                SELECT ip_address, hostname, status, open_ports, scan_timestamp
+                SELECT ip_int, ip_address, hostname, status, open_ports, scan_timestamp
                 FROM scan_results 
-                WHERE scan_id = ?
-                ORDER BY ip_address
-            ''', (scan_id,))
+                WHERE scan_id = ? AND ip_int > ?
+                ORDER BY ip_int
+                LIMIT ?
+            ''', (scan_id, after, batch_size))
+            rows = cursor.fetchall()
+            yield from rows
+            if len(rows) < batch_size:
+                return
+            after = rows[-1][0]
+
+    def _get_scan_info(self, cursor, scan_id: int) -> Optional[Dict]:
+        cursor.execute('''
+            SELECT scan_date, network_range, total_hosts, online_hosts, 
+                   scan_duration, notes, scan_strategy, base_scan_id, carried_hosts,
+                   EXISTS (SELECT 1 FROM scan_archives WHERE scan_id = scans.id), status
+            FROM scans 
+            WHERE id = ?
+        ''', (scan_id,))
+
+        scan_info = cursor.fetchone()
+        if not scan_info:
+            return None
+        return {
+            "scan_date": scan_info[0],
+            "network_range": scan_info[1],
+            "total_hosts": scan_info[2],
+            "online_hosts": scan_info[3],
+            "scan_duration": scan_info[4],
+            "notes": scan_info[5],
+            "scan_strategy": scan_info[6] or "full",
+            "base_scan_id": scan_info[7],
+            "carried_hosts": scan_info[8] or 0,
+            "archived": bool(scan_info[9]),
+            "status": scan_info[10] or "complete"
+        }
+
+    def get_scan_results(self, scan_id: int) -> Dict:
+        with self.connections.connection() as conn:
+            cursor = conn.cursor()
+
+            scan_info = self._get_scan_info(cursor, scan_id)
+            if not scan_info:
+                return {}
 
             results = {}
-            for row in cursor.fetchall():
-                ip, hostname, status, ports_json, timestamp = row
-                ports = json.loads(ports_json) if ports_json else []
-                results[ip] = {
-                    "status": status,
-                    "ports": ports,
-                    "hostname": hostname or "Unknown",
-                    "timestamp": timestamp
-                }
+            for row in self._iter_result_rows(cursor, scan_id, scan_info["scan_date"]):
+                results[row[1]] = self._result_entry(row)
 
             return {
-                "scan_info": {
-                    "scan_date": scan_info[0],
-                    "network_range": scan_info[1],
-                    "total_hosts": scan_info[2],
-                    "online_hosts": scan_info[3],
-                    "scan_duration": scan_info[4],
-                    "notes": scan_info[5]
-                },
+                "scan_info": scan_info,
                 "results": results
             }
 
-    def get_host_history(self, ip_address: str, limit: int = 10) -> List[Dict]:
-        with sqlite3.connect(self.db_path) as conn:
+    def iter_scan_results(self, scan_id: int, after: Optional[str] = None,
+                          batch_size: int = 1000) -> Iterator[Tuple[str, Dict]]:
+        """
+        Stream the (ip, result) pairs of a scan in address order, starting after
+        the `after` IP, holding at most batch_size rows in memory. Consume it on
+        the thread that started it.
+        """
+        with self.connections.connection() as conn:
+            cursor = conn.cursor()
+            scan_info = self._get_scan_info(cursor, scan_id)
+            if not scan_info:
+                return
+
+            start = ip_to_int(after) if after else -1
+            for row in self._iter_result_rows(cursor, scan_id, scan_info["scan_date"], start, batch_size):
+                yield row[1], self._result_entry(row)
+
+    def get_scan_results_page(self, scan_id: int, cursor: Optional[str] = None, limit: int = 500) -> Dict:
+        """
+        One page of a scan's results in address order. Pass the returned
+        next_cursor, the last IP of the page, to get the following page.
+        """
+        page = list(islice(self.iter_scan_results(scan_id, cursor, limit + 1), limit + 1))
+        results = dict(page[:limit])
+        next_cursor = page[limit - 1][0] if len(page) > limit else None
+        return {"scan_id": scan_id, "results": results, "next_cursor": next_cursor}
+
+    def _migrate_archives(self, cursor):
+        """Add the address bounds to archives and restore the scan_ports rows archiving used to delete"""
+        cursor.execute('ALTER TABLE scan_archives ADD COLUMN first_ip INTEGER')
+        cursor.execute('ALTER TABLE scan_archives ADD COLUMN last_ip INTEGER')
+
+        cursor.execute('SELECT scan_id FROM scan_archives')
+        for (scan_id,) in cursor.fetchall():
+            rows = self._get_archived_rows(cursor, scan_id)
+            if rows:
+                cursor.execute('UPDATE scan_archives SET first_ip = ?, last_ip = ? WHERE scan_id = ?',
+                               (rows[0][0], rows[-1][0], scan_id))
+            cursor.executemany('''
+                INSERT OR IGNORE INTO scan_ports (scan_id, ip_address, port, ip_int)
+                VALUES (?, ?, ?, ?)
+            ''', ((scan_id, ip, port, ip_int) for ip_int, ip, _, status, ports_json, _ in rows
+                  if status == "online" and ports_json for port in json.loads(ports_json)))
+
+    def _iter_archived_rows(self, cursor, first: int = 0, last: int = 2 ** 32 - 1,
+                            ips: Optional[List[int]] = None, where: str = "",
+                            params: tuple = ()) -> Iterator[Tuple[int, str, str, tuple]]:
+        """
+        (scan_id, scan_date, network_range, row) for the archived rows with ip_int
+        in [first, last], and in the sorted `ips` if given, newest scan first.
+        `where` adds conditions on the scans row `s`. Only archives whose address
+        bounds overlap are decompressed, on their own cursor so the caller's is free.
+        """
+        archives = cursor.connection.cursor()
+        archives.execute(f'''
+            SELECT a.scan_id, s.scan_date, s.network_range, a.results
+            FROM scan_archives a
+            JOIN scans s ON a.scan_id = s.id
+            WHERE COALESCE(a.first_ip, 0) <= ? AND COALESCE(a.last_ip, 4294967295) >= ? {where}
+            ORDER BY s.scan_date DESC, s.id DESC
+        ''', (last, first, *params))
+
+        for scan_id, scan_date, network_range, blob in archives:
+            rows = json.loads(zlib.decompress(blob))
+            keys = [row[0] for row in rows]
+            if ips is None:
+                selected = rows[bisect_left(keys, first):bisect_right(keys, last)]
+            else:
+                selected = []
+                for ip in ips:
+                    position = bisect_left(keys, ip)
+                    if position < len(keys) and keys[position] == ip:
+                        selected.append(rows[position])
+            for row in selected:
+                yield scan_id, scan_date, network_range, tuple(row)
+
+    def _iter_offline_hosts(self, cursor, first: int = 0, last: int = 2 ** 32 - 1,
+                            ips: Optional[List[int]] = None) -> Iterator[Tuple[int, str, str, int]]:
+        """
+        (scan_id, scan_date, network_range, ip_int) for the hosts in [first, last],
+        and in `ips` if given, that liveness bitmap scans probed and found offline
+        """
+        cursor.execute('''
+            SELECT l.scan_id, s.scan_date, s.network_range, l.first_ip, l.probed, l.online
+            FROM scan_liveness l
+            JOIN scans s ON l.scan_id = s.id
+            WHERE l.first_ip <= ? AND ? < l.first_ip + l.size
+        ''', (last, first))
+        for scan_id, scan_date, network_range, first_ip, probed, online in cursor.fetchall():
+            probed, online = zlib.decompress(probed), zlib.decompress(online)
+            if ips is None:
+                start = max(first, first_ip) - first_ip
+                hosts = (ip for ip in iter_set_bits(probed[start >> 3:], first_ip + (start >> 3 << 3))
+                         if first <= ip <= last)
+            else:
+                hosts = (ip for ip in ips if bit_is_set(probed, ip - first_ip))
+            for ip in hosts:
+                if not bit_is_set(online, ip - first_ip):
+                    yield scan_id, scan_date, network_range, ip
+
+    def _get_archived_rows(self, cursor, scan_id: int) -> Optional[List[tuple]]:
+        """Result rows of an archived scan in address order, None if it isn't archived"""
+        cursor.execute('SELECT results FROM scan_archives WHERE scan_id = ?', (scan_id,))
+        row = cursor.fetchone()
+        if not row:
+            return None
+        return [tuple(result) for result in json.loads(zlib.decompress(row[0]))]
+
+    def archive_scan(self, scan_id: int, chunk_rows: int = 5000, pause: float = 0.05) -> bool:
+        """
+        Pack the result rows of a scan into one compressed blob and delete the rows.
+        Deletes run in transactions of at most chunk_rows rows with a pause between,
+        so a running scan is never blocked for long. Readers switch to the blob as
+        soon as it is written. Liveness bitmaps are already compact and are kept,
+        and so are the scan_ports rows the port queries read.
+        """
+        with self.connections.connection() as conn:
+            cursor = conn.cursor()
+            if self._get_archived_rows(cursor, scan_id) is None:
+                cursor.execute('''
+                    SELECT ip_int, ip_address, hostname, status, open_ports, scan_timestamp
+                    FROM scan_results
+                    WHERE scan_id = ?
+                    ORDER BY ip_int
+                ''', (scan_id,))
+                rows = cursor.fetchall()
+                blob = zlib.compress(json.dumps(rows).encode())
+                cursor.execute('''
+                    INSERT INTO scan_archives (scan_id, results, first_ip, last_ip)
+                    VALUES (?, ?, ?, ?)
+                ''', (scan_id, blob, rows[0][0] if rows else None, rows[-1][0] if rows else None))
+                self._changed()
+
+        while True:
+            with self.connections.connection() as conn:
+                deleted = conn.execute('''
+                    DELETE FROM scan_results
+                    WHERE id IN (SELECT id FROM scan_results WHERE scan_id = ? LIMIT ?)
+                ''', (scan_id, chunk_rows)).rowcount
+                self._changed()
+            if deleted < chunk_rows:
+                break
+            time.sleep(pause)
+        return True
+
+    def archive_old_scans(self, days_to_keep: float = 30, chunk_rows: int = 5000, pause: float = 0.05) -> int:
+        """Archive every scan older than days_to_keep that still has result rows, returns how many"""
+        with self.connections.connection() as conn:
             cursor = conn.cursor()
             cursor.execute('''
+                SELECT id
+                FROM scans
+                WHERE scan_date < datetime('now', ?)
+                  AND (NOT EXISTS (SELECT 1 FROM scan_archives WHERE scan_id = scans.id)
+                       OR EXISTS (SELECT 1 FROM scan_results WHERE scan_id = scans.id))
+                ORDER BY id
+            ''', (f"-{days_to_keep} days",))
+            scan_ids = [row[0] for row in cursor.fetchall()]
+
+        for scan_id in scan_ids:
+            self.archive_scan(scan_id, chunk_rows, pause)
+        return len(scan_ids)
+
+    def _get_liveness(self, cursor, scan_id: int):
+        """(first_ip, probed, online) bitmaps of a scan saved with liveness bitmaps, else None"""
+        cursor.execute('SELECT first_ip, probed, online FROM scan_liveness WHERE scan_id = ?', (scan_id,))
+        row = cursor.fetchone()
+        if not row:
+            return None
+        return row[0], zlib.decompress(row[1]), zlib.decompress(row[2])
+
+    def _get_offline_history(self, cursor, ip_address: str, limit: int, before: Optional[List] = None) -> List[tuple]:
+        """
+        Latest scans, before the (scan_date, scan_id) cursor if given, whose liveness
+        bitmap has the host probed but offline, as history rows
+        """
+        ip = ip_to_int(ip_address)
+        before_date, before_id = before if before else (None, None)
+        cursor.execute('''
+            SELECT s.scan_date, s.network_range, l.scan_id, l.first_ip, l.probed, l.online
+            FROM scan_liveness l
+            JOIN scans s ON l.scan_id = s.id
+            WHERE l.first_ip <= ? AND ? < l.first_ip + l.size
+              AND (? IS NULL OR (s.scan_date, s.id) < (?, ?))
+            ORDER BY s.scan_date DESC, l.scan_id DESC
+        ''', (ip, ip, before_date, before_date, before_id))
+
+        history = []
+        for scan_date, network_range, scan_id, first_ip, probed, online in cursor:
+            offset = ip - first_ip
+            if bit_is_set(zlib.decompress(probed), offset) and not bit_is_set(zlib.decompress(online), offset):
+                history.append((scan_date, "Unknown", "offline", "[]", network_range, scan_id))
+                if len(history) >= limit:
+                    break
+        return history
+
+    @staticmethod
+    def _history_entry(row: tuple) -> Dict:
+        scan_date, hostname, status, ports_json, network_range, scan_id = row
+        return {
+            "scan_date": scan_date,
+            "hostname": hostname or "Unknown",
+            "status": status,
+            "ports": json.loads(ports_json) if ports_json else [],
+            "network_range": network_range,
+            "scan_id": scan_id
+        }
+
+    def get_host_history(self, ip_address: str, limit: int = 10) -> List[Dict]:
+        return self.get_host_history_page(ip_address, limit)["history"]
+
+    def get_host_history_page(self, ip_address: str, limit: int = 10, cursor: Optional[List] = None) -> Dict:
+        """
+        One page of a host's history, newest first. Pass the returned next_cursor,
+        a [scan_date, scan_id] pair, to get the following page.
+        """
+        before_date, before_id = cursor if cursor else (None, None)
+        with self.connections.connection() as conn:
+            db_cursor = conn.cursor()
+            db_cursor.execute('''
                 SELECT s.scan_date, sr.hostname, sr.status, sr.open_ports, s.network_range, sr.scan_id
                 FROM scan_results sr
                 JOIN scans s ON sr.scan_id = s.id
-                WHERE sr.ip_address = ?
-                ORDER BY s.scan_date DESC
+                WHERE sr.ip_address = ? AND (? IS NULL OR (s.scan_date, s.id) < (?, ?))
+                ORDER BY s.scan_date DESC, s.id DESC
                 LIMIT ?
-            ''', (ip_address, limit))
+            ''', (ip_address, before_date, before_date, before_id, limit))
+            rows = db_cursor.fetchall()
 
-            history = []
-            for row in cursor.fetchall():
-                scan_date, hostname, status, ports_json, network_range, scan_id = row
-                ports = json.loads(ports_json) if ports_json else []
-                history.append({
-                    "scan_date": scan_date,
-                    "hostname": hostname or "Unknown",
-                    "status": status,
-                    "ports": ports,
-                    "network_range": network_range,
-                    "scan_id": scan_id
-                })
+            extra = self._get_offline_history(db_cursor, ip_address, limit, cursor)
+            ip = ip_to_int(ip_address)
+            archived = self._iter_archived_rows(db_cursor, ip, ip, [ip],
+                                                "AND (? IS NULL OR (s.scan_date, s.id) < (?, ?))",
+                                                (before_date, before_date, before_id))
+            for scan_id, scan_date, scan_range, row in islice(archived, limit):
+                extra.append((scan_date, row[2], row[3], row[4], scan_range, scan_id))
+            if extra:
+                rows = sorted(rows + extra, key=lambda row: (row[0], row[5]), reverse=True)[:limit]
+
+            history = [self._history_entry(row) for row in rows]
+            next_cursor = [history[-1]["scan_date"], history[-1]["scan_id"]] if len(history) == limit else None
+            return {"history": history, "next_cursor": next_cursor}
+
+    def get_hosts_history(self, ip_addresses: List[str] = None, network_range: str = None,
+                          limit: int = 10) -> Dict[str, List[Dict]]:
+        """
+        The latest `limit` history entries of every host in ip_addresses or in the
+        CIDR network_range, newest first, keyed by IP in address order. Result rows
+        of all hosts come from one windowed query over the ip_int index, offline
+        hosts of liveness bitmap scans from one query over scan_liveness, and rows
+        of archived scans from the archives covering the addresses.
+        """
+        if network_range:
+            network = parse_network(network_range)
+            first, last = int(network.network_address), int(network.broadcast_address)
+            wanted = None
+        else:
+            wanted = sorted({ip_to_int(ip) for ip in ip_addresses or []})
+            if not wanted:
+                return {}
+            first, last = wanted[0], wanted[-1]
+
+        targets = None if wanted is None else json.dumps(wanted)
+        with self.connections.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT ip_int, scan_date, hostname, status, open_ports, network_range, scan_id
+                FROM (
+                    SELECT sr.ip_int, s.scan_date, sr.hostname, sr.status, sr.open_ports,
+                           s.network_range, sr.scan_id,
+                           ROW_NUMBER() OVER (
+                               PARTITION BY sr.ip_int ORDER BY s.scan_date DESC, s.id DESC
+                           ) AS position
+                    FROM scan_results sr
+                    JOIN scans s ON sr.scan_id = s.id
+                    WHERE sr.ip_int BETWEEN ? AND ?
+                      AND (? IS NULL OR sr.ip_int IN (SELECT value FROM json_each(?)))
+                )
+                WHERE position <= ?
+                ORDER BY ip_int, position
+            ''', (first, last, targets, targets, limit))
+
+            rows: Dict[int, List[tuple]] = {}
+            for ip, *row in cursor.fetchall():
+                rows.setdefault(ip, []).append(tuple(row))
+
+            # Rows of archived scans, then offline hosts of liveness bitmap scans
+            extra: Dict[int, List[tuple]] = {}
+            for scan_id, scan_date, scan_range, row in self._iter_archived_rows(cursor, first, last, wanted):
+                extra.setdefault(row[0], []).append((scan_date, row[2], row[3], row[4], scan_range, scan_id))
+
+            for scan_id, scan_date, scan_range, ip in self._iter_offline_hosts(cursor, first, last, wanted):
+                extra.setdefault(ip, []).append((scan_date, "Unknown", "offline", "[]", scan_range, scan_id))
 
+            history = {}
+            for ip in sorted(rows.keys() | extra.keys()):
+                host_rows = rows.get(ip, [])
+                if ip in extra:
+                    host_rows = sorted(host_rows + extra[ip], key=lambda row: (row[0], row[5]),
+                                       reverse=True)[:limit]
+                history[int_to_ip(ip)] = [self._history_entry(row) for row in host_rows]
             return history
 
     def get_online_hosts(self, scan_id: Optional[int] = None) -> List[Dict]:
-        with sqlite3.connect(self.db_path) as conn:
+        """Online hosts of a scan, or every host currently online across all scans by default"""
+        with self.connections.connection() as conn:
             cursor = conn.cursor()
 
             if scan_id is None:
-
-                cursor.execute('SELECT MAX(id) FROM scans')
-                result = cursor.fetchone()
-                if not result or not result[0]:
-                    return []
-                scan_id = result[0]
-
-            cursor.execute('''
-                SELECT ip_address, hostname, open_ports, scan_timestamp
-                FROM scan_results 
-                WHERE scan_id = ? AND status = 'online'
-                ORDER BY ip_address
-            ''', (scan_id,))
+                cursor.execute('''
+                    SELECT ip_address, hostname, open_ports, last_seen
+                    FROM host_state
+                    WHERE status = 'online'
+                    ORDER BY ip_int
+                ''')
+                rows = cursor.fetchall()
+            else:
+                archived = self._get_archived_rows(cursor, scan_id)
+                if archived is not None:
+                    rows = [(ip, hostname, ports_json, timestamp)
+                            for _, ip, hostname, status, ports_json, timestamp in archived
+                            if status == "online"]
+                else:
+                    cursor.execute('''
+                        SELECT ip_address, hostname, open_ports, scan_timestamp
+                        FROM scan_results 
+                        WHERE scan_id = ? AND status = 'online'
+                        ORDER BY ip_int
+                    ''', (scan_id,))
+                    rows = cursor.fetchall()
 
             hosts = []
-            for row in cursor.fetchall():
+            for row in rows:
                 ip, hostname, ports_json, timestamp = row
                 ports = json.loads(ports_json) if ports_json else []
                 hosts.append({
@@ -215,9 +880,387 @@ class NetworkScanDB:
 
             return hosts
 
+    def get_host_inventory(self) -> List[Dict]:
+        """Latest known state of every host ever seen online"""
+        with self.connections.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT ip_address, status, open_ports, hostname, first_seen, last_seen,
+                       last_checked, last_scan_id
+                FROM host_state
+                ORDER BY ip_int
+            ''')
+
+            return [{
+                "ip": row[0],
+                "status": row[1],
+                "ports": json.loads(row[2]) if row[2] else [],
+                "hostname": row[3] or "Unknown",
+                "first_seen": row[4],
+                "last_seen": row[5],
+                "last_checked": row[6],
+                "last_scan_id": row[7]
+            } for row in cursor.fetchall()]
+
+    def get_known_hostnames(self) -> Dict[str, str]:
+        """Latest hostname of every IP that was ever seen online"""
+        with self.connections.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('SELECT ip_address, hostname FROM host_state')
+
+            return {row[0]: row[1] or "Unknown" for row in cursor.fetchall()}
+
+    def get_recent_online_hosts(self, days: float) -> List[str]:
+        """IPs seen online in the last `days`, most recently seen first"""
+        with self.connections.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT ip_address
+                FROM host_state
+                WHERE last_seen >= datetime('now', ?)
+                ORDER BY last_seen DESC
+            ''', (f"-{days} days",))
+
+            return [row[0] for row in cursor.fetchall()]
+
+    def get_last_full_scan(self, network_range: str, max_age_hours: float) -> Optional[int]:
+        """ID of the newest completed full scan of the range that is at most max_age_hours old"""
+        with self.connections.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT MAX(id)
+                FROM scans
+                WHERE network_range = ? AND COALESCE(scan_strategy, 'full') = 'full'
+                  AND status = 'complete' AND scan_date >= datetime('now', ?)
+            ''', (network_range, f"-{max_age_hours} hours"))
+
+            return cursor.fetchone()[0]
+
+    def get_known_hosts(self, network_range: str, since_scan_id: int) -> Dict[str, List[int]]:
+        """Every IP seen online in a scan of the range since since_scan_id, with all ports seen open"""
+        with self.connections.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT sr.ip_address, sr.open_ports
+                FROM scan_results sr
+                JOIN scans s ON sr.scan_id = s.id
+                WHERE s.network_range = ? AND s.id >= ? AND sr.status = 'online'
+            ''', (network_range, since_scan_id))
+
+            rows = cursor.fetchall()
+            rows.extend((row[1], row[4]) for _, _, _, row in self._iter_archived_rows(
+                cursor, where="AND s.network_range = ? AND s.id >= ?", params=(network_range, since_scan_id))
+                if row[3] == "online")
+
+            hosts = {}
+            for ip, ports_json in rows:
+                ports = hosts.setdefault(ip, set())
+                ports.update(json.loads(ports_json) if ports_json else [])
+
+            return {ip: sorted(ports) for ip, ports in hosts.items()}
+
+    def _latest_scan_id(self, cursor) -> Optional[int]:
+        cursor.execute('SELECT MAX(id) FROM scans')
+        return cursor.fetchone()[0]
+
+    def get_hosts_with_port(self, port: int, scan_id: Optional[int] = None) -> List[str]:
+        """IPs that had the port open in a scan, the latest one by default, in address order"""
+        with self.connections.connection() as conn:
+            cursor = conn.cursor()
+            if scan_id is None:
+                scan_id = self._latest_scan_id(cursor)
+
+            cursor.execute('''
+                SELECT ip_address
+                FROM scan_ports
+                WHERE port = ? AND scan_id = ?
+                ORDER BY ip_int
+            ''', (port, scan_id))
+
+            return [row[0] for row in cursor.fetchall()]
+
+    def get_port_first_seen(self, port: int) -> Optional[Dict]:
+        """The first scan in which the port was open on any host, and those hosts in address order"""
+        with self.connections.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT s.id, s.scan_date, s.network_range
+                FROM scans s
+                WHERE s.id = (SELECT MIN(scan_id) FROM scan_ports WHERE port = ?)
+            ''', (port,))
+
+            row = cursor.fetchone()
+            if not row:
+                return None
+
+            cursor.execute('''
+                SELECT ip_address
+                FROM scan_ports
+                WHERE port = ? AND scan_id = ?
+                ORDER BY ip_int
+            ''', (port, row[0]))
+
+            return {
+                "scan_id": row[0],
+                "scan_date": row[1],
+                "network_range": row[2],
+                "hosts": [host[0] for host in cursor.fetchall()]
+            }
+
+    def get_port_history(self, port: int, limit: int = 10) -> List[Dict]:
+        """Number of hosts with the port open in each of the latest scans where it was open"""
+        with self.connections.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT p.scan_id, s.scan_date, s.network_range, p.hosts
+                FROM (
+                    SELECT scan_id, COUNT(*) AS hosts
+                    FROM scan_ports
+                    WHERE port = ?
+                    GROUP BY scan_id
+                    ORDER BY scan_id DESC
+                    LIMIT ?
+                ) p
+                JOIN scans s ON p.scan_id = s.id
+                ORDER BY p.scan_id DESC
+            ''', (port, limit))
+
+            return [{
+                "scan_id": row[0],
+                "scan_date": row[1],
+                "network_range": row[2],
+                "hosts": row[3]
+            } for row in cursor.fetchall()]
+
+    def get_open_port_counts(self, scan_id: Optional[int] = None) -> Dict[int, int]:
+        """Number of hosts with each port open in a scan, the latest one by default"""
+        with self.connections.connection() as conn:
+            cursor = conn.cursor()
+            if scan_id is None:
+                scan_id = self._latest_scan_id(cursor)
+
+            cursor.execute('''
+                SELECT port, COUNT(*)
+                FROM scan_ports
+                WHERE scan_id = ?
+                GROUP BY port
+                ORDER BY port
+            ''', (scan_id,))
+
+            return {row[0]: row[1] for row in cursor.fetchall()}
+
+    def get_hosts_in_range(self, network_range: str, online_only: bool = True) -> List[Dict]:
+        """
+        Every host of a CIDR range found in any scan, in address order, with how
+        often it was seen (online) and when it was first and last seen (online).
+        Runs as a range scan over the ip_int index, plus the overlapping archives and,
+        for offline hosts, liveness bitmaps.
+        """
+        network = parse_network(network_range)
+        first, last = int(network.network_address), int(network.broadcast_address)
+        with self.connections.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT sr.ip_address,
+                       COUNT(*),
+                       MIN(s.scan_date),
+                       MAX(s.scan_date),
+                       MAX(sr.scan_id)
+                FROM scan_results sr
+                JOIN scans s ON sr.scan_id = s.id
+                WHERE sr.ip_int BETWEEN ? AND ? AND (? = 0 OR sr.status = 'online')
+                GROUP BY sr.ip_int
+                ORDER BY sr.ip_int
+            ''', (first, last, int(online_only)))
+            hosts = {ip_to_int(row[0]): list(row) for row in cursor.fetchall()}
+
+            # Archived rows, and offline hosts of liveness bitmap scans unless online_only
+            seen = [(scan_id, scan_date, row[0]) for scan_id, scan_date, _, row
+                    in self._iter_archived_rows(cursor, first, last)
+                    if not online_only or row[3] == "online"]
+            if not online_only:
+                seen.extend((scan_id, scan_date, ip) for scan_id, scan_date, _, ip
+                            in self._iter_offline_hosts(cursor, first, last))
+
+            for scan_id, scan_date, ip in seen:
+                host = hosts.get(ip)
+                if host is None:
+                    hosts[ip] = [int_to_ip(ip), 1, scan_date, scan_date, scan_id]
+                else:
+                    host[1] += 1
+                    host[2] = min(host[2], scan_date)
+                    host[3] = max(host[3], scan_date)
+                    host[4] = max(host[4], scan_id)
+
+            return [{
+                "ip": row[0],
+                "scans": row[1],
+                "first_seen": row[2],
+                "last_seen": row[3],
+                "last_scan_id": row[4]
+            } for _, row in sorted(hosts.items())]
+
+    def get_previous_scan_id(self, network_range: str, scan_id: int) -> Optional[int]:
+        """The latest completed scan of the same network range before scan_id"""
+        with self.connections.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT id FROM scans
+                WHERE network_range = ? AND id < ? AND status = 'complete'
+                ORDER BY id DESC
+                LIMIT 1
+            ''', (network_range, scan_id))
+            row = cursor.fetchone()
+            return row[0] if row else None
+
+    def _load_diff_side(self, conn, side: int, scan_id: Optional[int]):
+        """Copy the hosts a scan probed, or the current host_state, into temp.diff_hosts"""
+        cursor = conn.cursor()
+        if scan_id is None:
+            cursor.execute('''
+                INSERT OR IGNORE INTO temp.diff_hosts
+                SELECT ?, ip_int, ip_address, status, COALESCE(hostname, 'Unknown'), COALESCE(open_ports, '[]')
+                FROM host_state
+            ''', (side,))
+            return
+
+        archived = self._get_archived_rows(cursor, scan_id)
+        if archived is None:
+            cursor.execute('''
+                INSERT OR IGNORE INTO temp.diff_hosts
+                SELECT ?, ip_int, ip_address, status, COALESCE(hostname, 'Unknown'), COALESCE(open_ports, '[]')
+                FROM scan_results
+                WHERE scan_id = ?
+            ''', (side, scan_id))
+        else:
+            cursor.executemany('''
+                INSERT OR IGNORE INTO temp.diff_hosts VALUES (?, ?, ?, ?, COALESCE(?, 'Unknown'), COALESCE(?, '[]'))
+            ''', ((side, ip_int, ip, status, hostname, ports_json)
+                  for ip_int, ip, hostname, status, ports_json, _ in archived))
+
+        liveness = self._get_liveness(cursor, scan_id)
+        if liveness is not None:
+            first_ip, probed, online = liveness
+            cursor.executemany('''
+                INSERT OR IGNORE INTO temp.diff_hosts VALUES (?, ?, ?, 'offline', 'Unknown', '[]')
+            ''', ((side, ip, int_to_ip(ip)) for ip in iter_set_bits(probed, first_ip)
+                  if not bit_is_set(online, ip - first_ip)))
+
+    def diff_scans(self, base_scan_id: int, scan_id: Optional[int] = None) -> Dict:
+        """
+        Changes from base_scan_id to scan_id, or to the current host_state when
+        scan_id is None: hosts that came online or went offline, opened and closed
+        ports and new hostnames. Only hosts probed by both sides are compared, so
+        hosts outside either range or carried forward by an incremental scan never
+        show up as added or removed.
+        """
+        with self.connections.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                CREATE TEMP TABLE IF NOT EXISTS diff_hosts (
+                    side INTEGER NOT NULL,  -- 0 base, 1 compared scan or state
+                    ip_int INTEGER NOT NULL,
+                    ip_address TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    hostname TEXT NOT NULL,
+                    open_ports TEXT NOT NULL,
+                    PRIMARY KEY (side, ip_int)
+                ) WITHOUT ROWID
+            ''')
+            cursor.execute('DELETE FROM temp.diff_hosts')
+            try:
+                self._load_diff_side(conn, 0, base_scan_id)
+                self._load_diff_side(conn, 1, scan_id)
+
+                cursor.execute('''
+                    SELECT n.ip_address, n.hostname, n.open_ports
+                    FROM temp.diff_hosts o
+                    JOIN temp.diff_hosts n ON n.side = 1 AND n.ip_int = o.ip_int
+                    WHERE o.side = 0 AND o.status = 'offline' AND n.status = 'online'
+                    ORDER BY o.ip_int
+                ''')
+                added = [{"ip": ip, "hostname": hostname, "ports": json.loads(ports_json)}
+                         for ip, hostname, ports_json in cursor.fetchall()]
+
+                cursor.execute('''
+                    SELECT o.ip_address, o.hostname
+                    FROM temp.diff_hosts o
+                    JOIN temp.diff_hosts n ON n.side = 1 AND n.ip_int = o.ip_int
+                    WHERE o.side = 0 AND o.status = 'online' AND n.status = 'offline'
+                    ORDER BY o.ip_int
+                ''')
+                removed = [{"ip": ip, "hostname": hostname} for ip, hostname in cursor.fetchall()]
+
+                # Ports that are open on one side only, for hosts online on both
+                cursor.execute('''
+                    SELECT o.ip_int, o.ip_address, 'opened', p.value
+                    FROM temp.diff_hosts o
+                    JOIN temp.diff_hosts n ON n.side = 1 AND n.ip_int = o.ip_int, json_each(n.open_ports) p
+                    WHERE o.side = 0 AND o.status = 'online' AND n.status = 'online'
+                      AND p.value NOT IN (SELECT value FROM json_each(o.open_ports))
+                    UNION ALL
+                    SELECT o.ip_int, o.ip_address, 'closed', p.value
+                    FROM temp.diff_hosts o
+                    JOIN temp.diff_hosts n ON n.side = 1 AND n.ip_int = o.ip_int, json_each(o.open_ports) p
+                    WHERE o.side = 0 AND o.status = 'online' AND n.status = 'online'
+                      AND p.value NOT IN (SELECT value FROM json_each(n.open_ports))
+                    ORDER BY 1, 4
+                ''')
+                port_changes: Dict[str, Dict] = {}
+                for _, ip, change, port in cursor.fetchall():
+                    entry = port_changes.setdefault(ip, {"ip": ip, "opened": [], "closed": []})
+                    entry[change].append(port)
+
+                # A failed reverse lookup is not a hostname change
+                cursor.execute('''
+                    SELECT o.ip_address, o.hostname, n.hostname
+                    FROM temp.diff_hosts o
+                    JOIN temp.diff_hosts n ON n.side = 1 AND n.ip_int = o.ip_int
+                    WHERE o.side = 0 AND o.status = 'online' AND n.status = 'online'
+                      AND n.hostname != o.hostname AND n.hostname != 'Unknown'
+                    ORDER BY o.ip_int
+                ''')
+                hostname_changes = [{"ip": ip, "old": old, "new": new} for ip, old, new in cursor.fetchall()]
+            finally:
+                cursor.execute('DELETE FROM temp.diff_hosts')
+
+            return {
+                "base_scan_id": base_scan_id,
+                "scan_id": scan_id,
+                "added": added,
+                "removed": removed,
+                "port_changes": list(port_changes.values()),
+                "hostname_changes": hostname_changes,
+                "summary": {
+                    "added": len(added),
+                    "removed": len(removed),
+                    "port_changes": len(port_changes),
+                    "hostname_changes": len(hostname_changes)
+                }
+            }
+
     def delete_old_scans(self, days_to_keep: int = 30):
-        with sqlite3.connect(self.db_path) as conn:
+        with self.connections.connection() as conn:
             cursor = conn.cursor()
+            # Offline hosts of liveness bitmaps have no rows, release their IPs from scanned_ips here
+            cursor.execute('''
+                SELECT l.first_ip, l.probed, l.online
+                FROM scan_liveness l
+                JOIN scans s ON l.scan_id = s.id
+                WHERE s.scan_date < datetime('now', '-{} days')
+            '''.format(days_to_keep))
+            for first_ip, probed, online in cursor.fetchall():
+                ips = self._offline_ips(first_ip, zlib.decompress(probed), zlib.decompress(online))
+                self._count_scanned_ips(cursor, ips, -1)
+
+            cursor.execute('''
+                DELETE FROM scan_liveness
+                WHERE scan_id IN (
+                    SELECT id FROM scans
+                    WHERE scan_date < datetime('now', '-{} days')
+                )
+            '''.format(days_to_keep))
+
             cursor.execute('''
                 DELETE FROM scan_results 
                 WHERE scan_id IN (
@@ -226,34 +1269,184 @@ class NetworkScanDB:
                 )
             '''.format(days_to_keep))
 
+            cursor.execute('''
+                DELETE FROM scan_ports
+                WHERE scan_id IN (
+                    SELECT id FROM scans
+                    WHERE scan_date < datetime('now', '-{} days')
+                )
+            '''.format(days_to_keep))
+
+            # Archived rows are no longer in scan_results, release their IPs from scanned_ips here
+            cursor.execute('''
+                SELECT a.results
+                FROM scan_archives a
+                JOIN scans s ON a.scan_id = s.id
+                WHERE s.scan_date < datetime('now', '-{} days')
+            '''.format(days_to_keep))
+            for (blob,) in cursor.fetchall():
+                ips = [(row[1],) for row in json.loads(zlib.decompress(blob))]
+                cursor.executemany('UPDATE scanned_ips SET results = results - 1 WHERE ip_address = ?', ips)
+            cursor.execute('DELETE FROM scanned_ips WHERE results <= 0')
+
+            cursor.execute('''
+                DELETE FROM scan_archives
+                WHERE scan_id IN (
+                    SELECT id FROM scans
+                    WHERE scan_date < datetime('now', '-{} days')
+                )
+            '''.format(days_to_keep))
+
             cursor.execute('''
                 DELETE FROM scans 
                 WHERE scan_date < datetime('now', '-{} days')
             '''.format(days_to_keep))
 
             deleted_count = cursor.rowcount
+            self._changed()
             conn.commit()
             return deleted_count
 
     def get_statistics(self) -> Dict:
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
+        return self.cache.get(("statistics",), self._load_statistics)
 
-            cursor.execute('SELECT COUNT(*) FROM scans')
-            total_scans = cursor.fetchone()[0]
+    def _load_statistics(self) -> Dict:
+        with self.connections.connection() as conn:
+            cursor = conn.cursor()
 
-            cursor.execute('SELECT COUNT(DISTINCT ip_address) FROM scan_results')
-            unique_ips = cursor.fetchone()[0]
+            cursor.execute('SELECT total_scans, online_hosts_sum, unique_ips FROM scan_statistics WHERE id = 1')
+            total_scans, online_hosts_sum, unique_ips = cursor.fetchone()
 
-            cursor.execute('SELECT MAX(scan_date) FROM scans')
-            last_scan = cursor.fetchone()[0]
+            # IDs grow with scan_date, so the newest scan is the last row
+            cursor.execute('SELECT scan_date FROM scans ORDER BY id DESC LIMIT 1')
+            row = cursor.fetchone()
+            last_scan = row[0] if row else None
 
-            cursor.execute('SELECT AVG(online_hosts) FROM scans')
-            avg_online = cursor.fetchone()[0] or 0
+            avg_online = online_hosts_sum / total_scans if total_scans else 0
 
             return {
                 "total_scans": total_scans,
                 "unique_ips_scanned": unique_ips,
                 "last_scan_date": last_scan,
                 "average_online_hosts": round(avg_online, 2)
-            }
\ No newline at end of file
+            }
+
+
+class ScanResultWriter:
+    """
+    Streams the results of a running scan into the database. Rows are buffered
+    and written with executemany, one transaction per batch of `batch_size` rows
+    or `batch_interval` seconds, and every batch also updates the totals of the
+    scans row. Results are queryable while the scan runs and survive a crash up
+    to the last batch. The scans row is "running" until finish() marks it
+    complete or fail() marks it failed.
+
+    With `liveness`, the ScanResults of the scan, only online hosts get rows and
+    every batch stores its probed and online bitmaps instead.
+    """
+
+    def __init__(self, db: NetworkScanDB, scan_id: int, batch_size: int = 1000, batch_interval: float = 1.0,
+                 liveness: ScanResults = None):
+        self.db = db
+        self.scan_id = scan_id
+        self.batch_size = batch_size
+        self.batch_interval = batch_interval
+        self.liveness = liveness
+        self.total_hosts = 0
+        self.online_hosts = 0
+
+        self._rows = []
+        self._ports = []
+        self._offline = []
+        self._pending = 0
+        self._flushed_at = time.monotonic()
+
+    def add(self, ip: str, status: str, ports: List[int] = None, hostname: str = "Unknown"):
+        ip_int = ip_to_int(ip)
+        if status == "online" or self.liveness is None:
+            self._rows.append((self.scan_id, ip, ip_int, hostname or "Unknown", status, json.dumps(ports or [])))
+            self._ports.extend((self.scan_id, ip, port, ip_int) for port in ports or [])
+        if status != "online":
+            self._offline.append(ip_int)
+
+        self.total_hosts += 1
+        if status == "online":
+            self.online_hosts += 1
+
+        self._pending += 1
+        if self._pending >= self.batch_size or time.monotonic() - self._flushed_at >= self.batch_interval:
+            self.flush()
+
+    def flush(self, **totals):
+        """Write the buffered rows and the current totals (plus any extra scans columns) in one transaction"""
+        rows, self._rows = self._rows, []
+        ports, self._ports = self._ports, []
+        offline, self._offline = self._offline, []
+        self._pending = 0
+        self._flushed_at = time.monotonic()
+
+        totals.update(total_hosts=self.total_hosts, online_hosts=self.online_hosts)
+        columns = ", ".join(f"{column} = ?" for column in totals)
+
+        with self.db.connections.connection() as conn:
+            cursor = conn.cursor()
+            if rows:
+                cursor.executemany('''
+                    INSERT INTO scan_results (scan_id, ip_address, ip_int, hostname, status, open_ports)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                ''', rows)
+            if ports:
+                cursor.executemany('''
+                    INSERT OR IGNORE INTO scan_ports (scan_id, ip_address, port, ip_int)
+                    VALUES (?, ?, ?, ?)
+                ''', ports)
+            if self.liveness is not None:
+                probed, online = self.liveness.bitmaps()
+                cursor.execute('''
+                    INSERT OR REPLACE INTO scan_liveness (scan_id, first_ip, size, probed, online, offline_hosts)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                ''', (self.scan_id, self.liveness.first, self.liveness.size,
+                      zlib.compress(probed), zlib.compress(online), self.total_hosts - self.online_hosts))
+                # Offline hosts have no scan_results row, count them in scanned_ips all the same
+                self.db._count_scanned_ips(cursor, [int_to_ip(ip) for ip in offline], 1)
+            self._update_host_state(cursor, rows, offline)
+            cursor.execute(f"UPDATE scans SET {columns} WHERE id = ?", (*totals.values(), self.scan_id))
+            self.db._changed()
+
+    def _update_host_state(self, cursor, rows: List[tuple], offline: List[int]):
+        """Upsert online hosts and mark known hosts offline, unless a newer scan already updated them"""
+        online = [(ip_int, ip, ports_json, hostname, self.scan_id)
+                  for _, ip, ip_int, hostname, status, ports_json in rows if status == "online"]
+        offline = [(self.scan_id, ip_int, self.scan_id) for ip_int in offline]
+
+        if online:
+            cursor.executemany('''
+                INSERT INTO host_state (ip_int, ip_address, status, open_ports, hostname,
+                                        first_seen, last_seen, last_checked, last_scan_id)
+                VALUES (?, ?, 'online', ?, ?, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP, ?)
+                ON CONFLICT (ip_int) DO UPDATE SET
+                    status = 'online',
+                    open_ports = excluded.open_ports,
+                    hostname = CASE WHEN excluded.hostname = 'Unknown' THEN host_state.hostname
+                                    ELSE excluded.hostname END,
+                    first_seen = COALESCE(host_state.first_seen, excluded.first_seen),
+                    last_seen = excluded.last_seen,
+                    last_checked = excluded.last_checked,
+                    last_scan_id = excluded.last_scan_id
+                WHERE excluded.last_scan_id >= host_state.last_scan_id
+            ''', online)
+        if offline:
+            cursor.executemany('''
+                UPDATE host_state
+                SET status = 'offline', last_checked = CURRENT_TIMESTAMP, last_scan_id = ?
+                WHERE ip_int = ? AND last_scan_id <= ?
+            ''', offline)
+
+    def finish(self, scan_duration: float = 0, carried_hosts: int = 0) -> int:
+        """Write the remaining rows and the final totals, returns the scan ID"""
+        self.flush(scan_duration=scan_duration, carried_hosts=carried_hosts, status="complete")
+        return self.scan_id
+
+    def fail(self):
+        """Write the rows received so far and mark the scan as failed"""
+        self.flush(status="failed")
@@ -0,0 +1,97 @@
+from __future__ import annotations
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List
+import sqlite3
+import threading
+
+# WAL lets dashboard reads run while a scan is being written. With WAL,
+# synchronous=NORMAL only syncs at checkpoints and can't corrupt the database.
+PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "cache_size": -32000,  # KiB per connection
+    "mmap_size": 256 * 1024 * 1024,
+    "temp_store": "MEMORY",
+    "busy_timeout": 5000,  # ms a writer waits for another writer
+}
+
+
+class ConnectionManager:
+    """
+    Pool of long-lived SQLite connections with tuned pragmas.
+
+    A connection is borrowed for the duration of a `with connection()` block,
+    which commits on success and rolls back on error like sqlite3.Connection
+    does, and nested blocks on the same thread share the outer connection.
+    Connections outlive the calls that use them, so the schema is parsed once
+    per connection and its statement cache keeps the prepared statements of
+    every query it has run. Callbacks registered with `after_commit()` run once
+    the outermost block has committed.
+    """
+
+    def __init__(self, db_path: str, pool_size: int = 8, pragmas: Dict = None,
+                 cached_statements: int = 256):
+        self.db_path = db_path
+        self.pool_size = pool_size
+        self.pragmas = PRAGMAS if pragmas is None else pragmas
+        self.cached_statements = cached_statements
+
+        self._idle: List[sqlite3.Connection] = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def _open(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, check_same_thread=False,
+                               cached_statements=self.cached_statements)
+        for name, value in self.pragmas.items():
+            conn.execute(f"PRAGMA {name} = {value}")
+        return conn
+
+    def _acquire(self) -> sqlite3.Connection:
+        with self._lock:
+            if self._idle:
+                return self._idle.pop()
+        return self._open()
+
+    def _release(self, conn: sqlite3.Connection):
+        with self._lock:
+            if len(self._idle) < self.pool_size:
+                self._idle.append(conn)
+                return
+        conn.close()
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            yield conn
+            return
+
+        conn = self._acquire()
+        self._local.conn = conn
+        self._local.callbacks = []
+        try:
+            with conn:
+                yield conn
+        finally:
+            callbacks, self._local.callbacks = self._local.callbacks, []
+            self._local.conn = None
+            self._release(conn)
+
+        for callback in callbacks:
+            callback()
+
+    def after_commit(self, callback: Callable[[], None]):
+        """Run callback once the transaction of this thread commits, or now outside of one"""
+        if getattr(self._local, "conn", None) is None:
+            callback()
+        elif callback not in self._local.callbacks:
+            self._local.callbacks.append(callback)
+
+    def close(self):
+        """Close idle connections and stop pooling, borrowed ones are closed when returned"""
+        with self._lock:
+            idle, self._idle = self._idle, []
+            self.pool_size = 0
+        for conn in idle:
+            conn.close()
@@ -0,0 +1,117 @@
+from __future__ import annotations
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeout
+from typing import Dict, Optional
+import socket
+import threading
+import time
+
+from rate_limiter import TokenBucket
+from targets import int_to_ip
+
+UNKNOWN_HOSTNAME = "Unknown"
+
+
+class HostnameResolver:
+    """
+    Reverse DNS resolver with its own thread pool, a per-lookup timeout and an
+    LRU cache with TTL. Hosts are IPv4 addresses as integers.
+
+    Failed lookups (no PTR record) are cached for `negative_ttl`, timeouts are
+    not cached so the next scan retries them. Concurrent lookups of the same
+    address share one query.
+    """
+
+    def __init__(self, threads: int = 32, timeout: float = 2.0, cache_size: int = 100000,
+                 ttl: float = 86400, negative_ttl: float = 3600, rate_limiter: TokenBucket = None):
+        self.threads = max(1, threads)
+        self.timeout = timeout
+        self.cache_size = cache_size
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.rate_limiter = rate_limiter
+
+        self._cache: OrderedDict[int, tuple] = OrderedDict()
+        self._in_flight: Dict[int, Future] = {}
+        self._lock = threading.RLock()
+        self._executor = ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix="resolver")
+
+        self.hits = 0
+        self.misses = 0
+        self.timeouts = 0
+
+    def _store(self, ip: int, hostname: Optional[str], ttl: float):
+        self._cache[ip] = (hostname, time.monotonic() + ttl)
+        self._cache.move_to_end(ip)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    def seed(self, hostnames: Dict[int, str]):
+        """Pre-fill the cache with known hostnames, "Unknown" is cached as a negative entry"""
+        with self._lock:
+            for ip, hostname in hostnames.items():
+                if hostname and hostname != UNKNOWN_HOSTNAME:
+                    self._store(ip, hostname, self.ttl)
+                else:
+                    self._store(ip, None, self.negative_ttl)
+
+    def _cached(self, ip: int):
+        entry = self._cache.get(ip)
+        if entry is None:
+            return False, None
+        hostname, expires = entry
+        if expires < time.monotonic():
+            del self._cache[ip]
+            return False, None
+        self._cache.move_to_end(ip)
+        return True, hostname
+
+    def _query(self, ip: int) -> Optional[str]:
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire()
+        try:
+            hostname, _, _ = socket.gethostbyaddr(int_to_ip(ip))
+            return hostname
+        except (socket.herror, socket.gaierror):
+            return None
+
+    def _finish(self, ip: int, future: Future):
+        with self._lock:
+            self._in_flight.pop(ip, None)
+            try:
+                hostname = future.result()
+            except Exception:
+                return
+            self._store(ip, hostname, self.ttl if hostname else self.negative_ttl)
+
+    def lookup(self, ip: int, timeout: float = None) -> str:
+        with self._lock:
+            found, hostname = self._cached(ip)
+            if found:
+                self.hits += 1
+                return hostname or UNKNOWN_HOSTNAME
+
+            self.misses += 1
+            future = self._in_flight.get(ip)
+            if future is None:
+                future = self._executor.submit(self._query, ip)
+                self._in_flight[ip] = future
+                future.add_done_callback(lambda done: self._finish(ip, done))
+
+        try:
+            return future.result(timeout=timeout or self.timeout) or UNKNOWN_HOSTNAME
+        except FutureTimeout:
+            with self._lock:
+                self.timeouts += 1
+            return UNKNOWN_HOSTNAME
+        except Exception:
+            return UNKNOWN_HOSTNAME
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "cached": len(self._cache),
+                "hits": self.hits,
+                "misses": self.misses,
+                "timeouts": self.timeouts
+            }
@@ -0,0 +1,177 @@
+from __future__ import annotations
+from collections import deque
+from typing import Iterable, Iterator, Optional, Tuple
+import itertools
+import os
+import select
+import socket
+import struct
+import time
+
+from rate_limiter import TokenBucket
+from targets import int_to_ip
+
+ICMP_ECHO_REPLY = 0
+ICMP_ECHO_REQUEST = 8
+
+_instance_ids = itertools.count()
+
+
+def icmp_checksum(data: bytes) -> int:
+    if len(data) % 2:
+        data += b"\x00"
+    total = sum(struct.unpack(f"!{len(data) // 2}H", data))
+    total = (total >> 16) + (total & 0xFFFF)
+    total += total >> 16
+    return ~total & 0xFFFF
+
+
+def build_echo_request(identifier: int, sequence: int, payload: bytes = b"") -> bytes:
+    header = struct.pack("!BBHHH", ICMP_ECHO_REQUEST, 0, 0, identifier, sequence)
+    checksum = icmp_checksum(header + payload)
+    return struct.pack("!BBHHH", ICMP_ECHO_REQUEST, 0, checksum, identifier, sequence) + payload
+
+
+def open_icmp_socket() -> Tuple[socket.socket, bool]:
+    """
+    Open an unprivileged datagram ICMP socket, or a raw one if that is not permitted.
+    Returns (socket, is_raw). Raises OSError if neither can be opened.
+    """
+    try:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_ICMP)
+        return sock, False
+    except OSError:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_RAW, socket.IPPROTO_ICMP)
+        return sock, True
+
+
+class IcmpSweep:
+    """
+    Ping sweep over a single shared ICMP socket.
+
+    Echo requests are sent while replies are read from the same socket, and
+    replies are matched to probes by identifier and sequence number. At most
+    `window` probes are outstanding at any time, and sends are paced by the
+    optional shared rate limiter.
+    """
+
+    def __init__(self, timeout: float = 2.0, window: int = 1024, rate_limiter: TokenBucket = None):
+        self.timeout = timeout
+        self.window = max(1, min(window, 0xFFFF))
+        self.rate_limiter = rate_limiter
+        self.sock, self.raw = open_icmp_socket()
+        self.sock.setblocking(False)
+        try:
+            # Replies to a full window arrive in bursts, a small buffer silently drops them
+            self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4 * 1024 * 1024)
+        except OSError:
+            pass
+
+        if self.raw:
+            self.identifier = (os.getpid() + next(_instance_ids)) & 0xFFFF
+        else:
+            # The kernel replaces the identifier of datagram ICMP sockets with the local port
+            self.sock.bind(("0.0.0.0", 0))
+            self.identifier = self.sock.getsockname()[1]
+
+        self._sequence = 0
+
+    def close(self):
+        self.sock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _next_sequence(self) -> int:
+        self._sequence = (self._sequence + 1) & 0xFFFF
+        return self._sequence
+
+    def _parse_reply(self, packet: bytes) -> Optional[Tuple[int, int]]:
+        if self.raw:
+            header_length = (packet[0] & 0x0F) * 4
+            packet = packet[header_length:]
+        if len(packet) < 8:
+            return None
+
+        icmp_type, _, _, identifier, sequence = struct.unpack("!BBHHH", packet[:8])
+        if icmp_type != ICMP_ECHO_REPLY or identifier != self.identifier:
+            return None
+        return identifier, sequence
+
+    def sweep(self, targets: Iterable[int]) -> Iterator[Tuple[int, bool, Optional[float]]]:
+        """
+        Probe every target (IPv4 address as integer) once. Yields
+        (ip, is_online, rtt_seconds) as soon as a reply arrives or the probe
+        times out, so results come back unordered. Targets are pulled lazily.
+        """
+        targets = iter(targets)
+        exhausted = False
+        pending = {}
+        deadlines = deque()
+
+        while not exhausted or pending:
+            throttled = False
+            while not exhausted and len(pending) < self.window:
+                if self.rate_limiter is not None and not self.rate_limiter.try_acquire():
+                    throttled = True
+                    break
+
+                ip = next(targets, None)
+                if ip is None:
+                    exhausted = True
+                    break
+
+                sequence = self._next_sequence()
+                packet = build_echo_request(self.identifier, sequence, struct.pack("!d", time.time()))
+                sent_at = time.monotonic()
+                address = int_to_ip(ip)
+                try:
+                    self.sock.sendto(packet, (address, 0))
+                except OSError:
+                    yield ip, False, None
+                    continue
+
+                pending[sequence] = (ip, sent_at, address)
+                deadlines.append((sent_at + self.timeout, sequence, sent_at))
+
+            now = time.monotonic()
+            wait = max(0.0, deadlines[0][0] - now) if deadlines else 0.05
+            if throttled:
+                wait = min(wait, self.rate_limiter.delay())
+            readable, _, _ = select.select([self.sock], [], [], min(wait, 0.05))
+
+            if readable:
+                while True:
+                    try:
+                        packet, address = self.sock.recvfrom(2048)
+                    except (BlockingIOError, InterruptedError):
+                        break
+                    except OSError:
+                        break
+
+                    received_at = time.monotonic()
+                    parsed = self._parse_reply(packet)
+                    if parsed is None:
+                        continue
+
+                    _, sequence = parsed
+                    entry = pending.get(sequence)
+                    if entry is None or entry[2] != address[0]:
+                        continue
+
+                    del pending[sequence]
+                    yield entry[0], True, received_at - entry[1]
+
+            now = time.monotonic()
+            while deadlines and deadlines[0][0] <= now:
+                _, sequence, sent_at = deadlines.popleft()
+                entry = pending.get(sequence)
+                if entry is not None and entry[1] == sent_at:
+                    del pending[sequence]
+                    yield entry[0], False, None
+
+            while deadlines and deadlines[0][1] not in pending:
+                deadlines.popleft()
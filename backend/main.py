@@ -1,30 +1,71 @@
 from __future__ import annotations
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from contextlib import closing
 import time
 from socket import *
 import subprocess
 import platform
 import ipaddress
+from typing import Dict, Iterator, List
 from parser import Parser
-from database import NetworkScanDB
+from database import NetworkScanDB, ScanResultWriter
+from icmp_sweep import IcmpSweep
+from port_scanner import AsyncPortScanner
+from scan_pipeline import ScanPipeline
+from targets import int_to_ip, ip_to_int, host_count, host_range, prioritized_targets
+from result_store import ScanResults
+from sharded_scan import ShardedScan
+from scan_coordinator import ScanCoordinator
+from rate_limiter import TokenBucket
+from rtt_estimator import RttEstimator
+from hostname_resolver import HostnameResolver
+
+
+# Reverse lookups take a round trip to the resolver and possibly on to the
+# authoritative server, so they get a few RTOs of the host's path, but never
+# less than this share of the resolver timeout: the resolver is not the host,
+# and a fast LAN host says nothing about how long an uncached PTR lookup takes
+DNS_RTO_MULTIPLIER = 4
+DNS_TIMEOUT_FLOOR = 0.5
 
 
 class NetworkScan:
-    def __init__(self):
+    def __init__(self, db: NetworkScanDB = None, worker: bool = False):
+        """
+        A `worker` only scans the targets it is handed, for the sharded and
+        distributed modes, and never opens the database.
+        """
         self.config = Parser()
         self.client_ip = gethostbyname(self.config.return_var("scanner", "ip"))
         self.threads = int(self.config.return_var("scanner", "threads"))
         self.ports = self.config.return_list("scanner", "ports", "int")
-        self.db = NetworkScanDB()
-
-    def get_hostname_from_ip(self, ip: str) -> str:
-        try:
-            hostname, _, _ = gethostbyaddr(ip)
-            return hostname
-        except (herror, gaierror, timeout):
-            return "Unknown"
-        except Exception:
-            return "Unknown"
+        self.max_in_flight = int(self.config.return_var("scanner", "max_in_flight"))
+        self.connect_timeout = float(self.config.return_var("scanner", "connect_timeout"))
+        self.min_timeout = float(self.config.return_var("scanner", "min_timeout"))
+        self.max_timeout = float(self.config.return_var("scanner", "max_timeout"))
+        self.mode = self.config.return_var("scanner", "mode")
+        self.processes = int(self.config.return_var("scanner", "processes"))
+        self.priority_days = float(self.config.return_var("scanner", "priority_days"))
+        self.neighbor_radius = int(self.config.return_var("scanner", "neighbor_radius"))
+        self.coordinator = None
+        self.liveness_bitmap = self.config.return_var("database", "liveness_bitmap").lower() == "true"
+        self.incremental = self.config.return_var("incremental", "enabled").lower() == "true"
+        self.full_sweep_hours = float(self.config.return_var("incremental", "full_sweep_hours"))
+        self.rate_limiter = TokenBucket(
+            rate=float(self.config.return_var("scanner", "rate_pps")),
+            burst=int(self.config.return_var("scanner", "burst"))
+        )
+        self.db = None if worker else db or NetworkScanDB()
+        self.resolver = HostnameResolver(
+            threads=int(self.config.return_var("resolver", "threads")),
+            timeout=float(self.config.return_var("resolver", "timeout")),
+            cache_size=int(self.config.return_var("resolver", "cache_size")),
+            ttl=float(self.config.return_var("resolver", "ttl")),
+            negative_ttl=float(self.config.return_var("resolver", "negative_ttl")),
+            rate_limiter=self.rate_limiter
+        )
+        if self.db is not None:
+            self.resolver.seed({ip_to_int(ip): hostname for ip, hostname in self.db.get_known_hostnames().items()})
 
     def get_current_ip(self) -> str | Exception:
         try:
@@ -98,47 +139,173 @@ class NetworkScan:
         except Exception as e:
             return "24"
 
-    def combined_scan(self, network_range: str = None, ping_timeout: int = 2,
-                      save_to_db: bool = True, notes: str = None) -> dict:
-        def ping_single_host(ip_str: str) -> tuple[str, bool]:
-            """Internal function to ping a single host"""
-            try:
-                if platform.system().lower() == 'windows':
-                    cmd = ['ping', '-n', '1', '-w', str(ping_timeout), ip_str]
-                else:
-                    cmd = ['ping', '-c', '1', '-W', str(ping_timeout), ip_str]
-
-                result = subprocess.run(
-                    cmd,
-                    capture_output=True,
-                    text=True,
-                    timeout=ping_timeout + 1,
-                    encoding='utf-8',
-                    errors='ignore'
-                )
-                return ip_str, result.returncode == 0
+    def ping_host(self, ip_str: str, ping_timeout: int = 2) -> tuple[str, bool]:
+        """Ping a single host with the system ping command"""
+        try:
+            if platform.system().lower() == 'windows':
+                cmd = ['ping', '-n', '1', '-w', str(ping_timeout * 1000), ip_str]
+            else:
+                cmd = ['ping', '-c', '1', '-W', str(ping_timeout), ip_str]
+
+            result = subprocess.run(
+                cmd,
+                capture_output=True,
+                text=True,
+                timeout=ping_timeout + 1,
+                encoding='utf-8',
+                errors='ignore'
+            )
+            return ip_str, result.returncode == 0
 
-            except Exception:
-                return ip_str, False
-
-        def scan_ip_ports_and_hostname(ip: str) -> tuple[str, list[int], str]:
-            scanned_ports = []
-            for port in self.ports:
-                try:
-                    s = socket(AF_INET, SOCK_STREAM)
-                    s.settimeout(1.0)
-                    connection = s.connect_ex((ip, port))
-                    if connection == 0:
-                        scanned_ports.append(port)
-                    s.close()
-                except Exception:
-                    continue
-                time.sleep(0.01)
-            hostname = self.get_hostname_from_ip(ip)
-            
-            return ip, scanned_ports, hostname
+        except Exception:
+            return ip_str, False
+
+    def ping_sweep(self, host_ips, ping_timeout: int = 2):
+        """
+        Yields (ip, is_online, rtt) for every host (IPv4 address as integer) as results arrive.
+        Uses one shared ICMP socket and falls back to one ping process per host
+        if the socket can't be opened. Targets are consumed lazily in both cases.
+        """
+        try:
+            sweeper = IcmpSweep(timeout=ping_timeout, rate_limiter=self.rate_limiter)
+        except OSError as e:
+            print(f"ICMP socket unavailable ({e}), falling back to ping subprocesses")
+            sweeper = None
+
+        if sweeper is not None:
+            with sweeper:
+                yield from sweeper.sweep(host_ips)
+            return
 
+        window = self.threads * 4
+        with ThreadPoolExecutor(max_workers=self.threads) as executor:
+            pending = {}
+            for ip in host_ips:
+                if len(pending) >= window:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        yield pending.pop(future), future.result()[1], None
+                self.rate_limiter.acquire()
+                pending[executor.submit(self.ping_host, int_to_ip(ip), ping_timeout)] = ip
+
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield pending.pop(future), future.result()[1], None
+
+    def recent_hosts(self) -> List[int]:
+        """Hosts seen online in the last priority_days, most recently seen first"""
+        if self.priority_days <= 0:
+            return []
+        return [ip_to_int(ip) for ip in self.db.get_recent_online_hosts(self.priority_days)]
+
+    def targets_by_priority(self, first: int, last: int, recent: List[int] = None) -> Iterator[int]:
+        """
+        Every address of [first, last] ordered by past liveness: recently online
+        hosts, then their neighbours, then addresses never seen online.
+        """
+        if recent is None:
+            recent = self.recent_hosts()
+        return prioritized_targets(first, last, recent, self.neighbor_radius)
+
+    def dns_timeout(self, ip: int, rtt_estimator: RttEstimator) -> float:
+        """Reverse DNS timeout of a host, between DNS_TIMEOUT_FLOOR and 1 times the resolver timeout"""
+        rtt_based = rtt_estimator.timeout(ip, multiplier=DNS_RTO_MULTIPLIER)
+        return min(self.resolver.timeout, max(self.resolver.timeout * DNS_TIMEOUT_FLOOR, rtt_based))
+
+    def scan_hosts(self, host_ips, ping_timeout: int = 2, ports_for: Dict[int, List[int]] = None):
+        """
+        Ping sweep, port scan and hostname resolution as one streaming pipeline
+        over IPv4 addresses as integers. Yields ("ping", ip, is_online, rtt) and
+        ("host", ip, open_ports, hostname) events.
+        Connect and reverse DNS timeouts follow the RTT measured by the ping sweep,
+        per host and per /24. `ports_for` overrides the configured ports per host.
+        """
+        rtt_estimator = RttEstimator(self.connect_timeout, self.min_timeout, self.max_timeout)
+        pipeline = ScanPipeline(
+            ping_sweep=lambda targets: self.ping_sweep(targets, ping_timeout),
+            port_scanner=AsyncPortScanner(self.ports, self.max_in_flight, self.connect_timeout,
+                                          self.rate_limiter, rtt_estimator, ports_for),
+            resolve=lambda ip: self.resolver.lookup(ip, self.dns_timeout(ip, rtt_estimator)),
+            resolver_threads=self.resolver.threads,
+            rtt_estimator=rtt_estimator
+        )
+        return pipeline.run(host_ips)
+
+    def scan_network(self, network: ipaddress.IPv4Network, ping_timeout: int = 2, mode: str = None,
+                     known_hosts: Dict[int, List[int]] = None):
+        """
+        Scan every host of the network, yielding the same events as scan_hosts.
+        mode "threaded" runs one pipeline in this process, "sharded" splits the
+        range across a pool of worker processes and "distributed" hands CIDR
+        shards to scan workers connected to the coordinator. In every mode
+        hosts recently seen online are probed first.
+        With `known_hosts` (IP as integer -> ports) only those hosts and ports
+        are probed, always in this process since the target list is small.
+        """
+        if known_hosts is not None:
+            return self.scan_hosts(sorted(known_hosts), ping_timeout, ports_for=known_hosts)
+
+        mode = mode or self.mode
+        if mode == "sharded":
+            return ShardedScan(self.processes).run(network, ping_timeout, self.recent_hosts())
+        if mode == "distributed":
+            return self.get_coordinator().run(network, ping_timeout, self.recent_hosts())
+        if mode != "threaded":
+            raise ValueError(f"Unknown scan mode: {mode}")
+        return self.scan_hosts(self.targets_by_priority(*host_range(network)), ping_timeout)
+
+    def plan_scan(self, network_range: str, incremental: bool = None):
+        """
+        Decide between a full sweep and an incremental scan of a network range.
+        Returns (strategy, base_scan_id, known_hosts). An incremental scan only
+        refreshes the hosts seen online since the last full sweep, on the ports
+        they had open, and carries the rest of the range forward from that sweep.
+        A full sweep is due when none ran in the last `full_sweep_hours`.
+        """
+        if incremental is None:
+            incremental = self.incremental
+        if not incremental:
+            return "full", None, None
+
+        base_scan_id = self.db.get_last_full_scan(network_range, self.full_sweep_hours)
+        if base_scan_id is None:
+            return "full", None, None
+
+        known_hosts = {ip_to_int(ip): ports for ip, ports in
+                       self.db.get_known_hosts(network_range, base_scan_id).items()}
+        return "incremental", base_scan_id, known_hosts
+
+    def get_coordinator(self) -> ScanCoordinator:
+        if self.coordinator is None:
+            self.coordinator = ScanCoordinator(
+                host=self.config.return_var("coordinator", "host"),
+                port=int(self.config.return_var("coordinator", "port")),
+                shard_prefix=int(self.config.return_var("coordinator", "shard_prefix")),
+                lease_seconds=float(self.config.return_var("coordinator", "lease_seconds")),
+                worker_wait=float(self.config.return_var("coordinator", "worker_wait")),
+                token=self.config.return_var("coordinator", "token")
+            )
+        return self.coordinator
+
+    @staticmethod
+    def record_event(event: tuple, results: ScanResults, writer: ScanResultWriter = None):
+        """Apply one pipeline event to the scan results and stream it to the database"""
+        if event[0] == "ping":
+            _, ip, is_online, _ = event
+            results.set_online(ip, is_online)
+            if writer is not None and not is_online:
+                writer.add(int_to_ip(ip), "offline")
+        else:
+            _, ip, open_ports, hostname = event
+            results.set_host(ip, open_ports, hostname)
+            if writer is not None:
+                writer.add(int_to_ip(ip), "online", open_ports, hostname)
+
+    def combined_scan(self, network_range: str = None, ping_timeout: int = 2, save_to_db: bool = True,
+                      notes: str = None, mode: str = None, incremental: bool = None) -> dict:
         results = {}
+        writer = None
 
         try:
             if network_range is None:
@@ -149,60 +316,39 @@ class NetworkScan:
                 network_range = f"{current_ip}/{subnet}"
 
             network = ipaddress.IPv4Network(network_range, strict=False)
-            host_ips = [str(ip) for ip in network.hosts()]
+            strategy, base_scan_id, known_hosts = self.plan_scan(network_range, incremental)
+            total_hosts = host_count(network) if known_hosts is None else len(known_hosts)
 
-            print(f"Starting scan of {len(host_ips)} hosts in {network_range}...")
+            print(f"Starting {strategy} scan of {total_hosts} hosts in {network_range}...")
             start_time = time.time()
 
-            online_hosts = []
-            with ThreadPoolExecutor(max_workers=self.threads) as executor:
-                futures = [executor.submit(ping_single_host, ip) for ip in host_ips]
-
-                for future in as_completed(futures):
-                    try:
-                        ip, is_online = future.result()
-                        if is_online:
-                            online_hosts.append(ip)
-                            results[ip] = {"status": "online", "ports": [], "hostname": "Unknown"}
-                        else:
-                            results[ip] = {"status": "offline", "ports": [], "hostname": "Unknown"}
-                    except Exception:
-                        continue
-
-            print(f"Found {len(online_hosts)} online hosts. Starting port scan and hostname resolution...")
-
-            if online_hosts:
-                with ThreadPoolExecutor(max_workers=self.threads) as executor:
-                    futures = [executor.submit(scan_ip_ports_and_hostname, ip) for ip in online_hosts]
-
-                    for future in as_completed(futures):
-                        try:
-                            ip, open_ports, hostname = future.result()
-                            results[ip]["ports"] = open_ports
-                            results[ip]["hostname"] = hostname
-                        except Exception as e:
-                            print(f"Error scanning IP {ip}: {e}")
+            results = ScanResults(network)
+            if save_to_db:
+                writer = self.db.begin_scan(network_range, notes, strategy, base_scan_id,
+                                            results if self.liveness_bitmap else None)
+            # closing() stops the scan stages if recording an event fails
+            with closing(self.scan_network(network, ping_timeout, mode, known_hosts)) as events:
+                for event in events:
+                    self.record_event(event, results, writer)
 
             elapsed_time = time.time() - start_time
             print(f"Combined scan finished in: {elapsed_time:.2f}s")
 
-            online_count = sum(1 for host in results.values() if host["status"] == "online")
-            hosts_with_ports = sum(1 for host in results.values() if len(host["ports"]) > 0)
-            print(f"Summary: {online_count}/{len(host_ips)} hosts online, {hosts_with_ports} hosts with open ports")
+            print(f"Summary: {results.online_count}/{total_hosts} hosts online, "
+                  f"{results.hosts_with_ports} hosts with open ports")
 
-            if save_to_db:
-                scan_id = self.db.save_scan_results(
-                    results=results,
-                    network_range=network_range,
-                    scan_duration=elapsed_time,
-                    notes=notes
-                )
+            if writer is not None:
+                scan_id = writer.finish(elapsed_time, host_count(network) - len(results))
+                # The scan is saved, nothing below may mark it failed
+                writer = None
                 print(f"Results saved to database with scan ID: {scan_id}")
 
             return results
 
         except Exception as e:
             print(f"Scan error: {e}")
+            if writer is not None:
+                writer.fail()
             return results
 
     def show_scan_history(self, limit: int = 5):
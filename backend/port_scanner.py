@@ -0,0 +1,148 @@
+from __future__ import annotations
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+import asyncio
+import socket
+import threading
+import time
+
+from rate_limiter import TokenBucket
+from rtt_estimator import RttEstimator
+from targets import int_to_ip
+
+# file descriptors left for everything but connect sockets (ICMP socket, database, resolver)
+FD_HEADROOM = 256
+
+
+def raise_open_file_limit(required: int) -> Optional[int]:
+    """
+    Raise the soft open file limit towards `required` and return the limit in
+    effect afterwards, None if it is unlimited or unknown
+    """
+    try:
+        import resource
+    except ImportError:
+        return None
+
+    try:
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        if soft != resource.RLIM_INFINITY and soft < required:
+            target = required if hard == resource.RLIM_INFINITY else min(required, hard)
+            resource.setrlimit(resource.RLIMIT_NOFILE, (target, hard))
+        soft, _ = resource.getrlimit(resource.RLIMIT_NOFILE)
+    except (ValueError, OSError):
+        return None
+    return None if soft == resource.RLIM_INFINITY else soft
+
+
+class AsyncPortScanner:
+    """
+    TCP connect scanner running non-blocking connects on an asyncio event loop.
+
+    Every (host, port) pair of a scan shares one limit of `max_in_flight`
+    concurrent connection attempts, and connects are paced by the optional
+    shared rate limiter. A host is reported as soon as all of its ports have
+    been checked. With an RTT estimator, each connect times out after the
+    host's estimated RTO instead of the fixed `timeout`, and every answered
+    connect (accepted or refused) refines that estimate. `ports_for` overrides
+    the port list of individual hosts. `max_in_flight` is lowered to what the
+    open file limit allows.
+    """
+
+    def __init__(self, ports: List[int], max_in_flight: int = 1000, timeout: float = 1.0,
+                 rate_limiter: TokenBucket = None, rtt_estimator: RttEstimator = None,
+                 ports_for: Dict[int, List[int]] = None):
+        self.ports = list(ports)
+        self.ports_for = ports_for or {}
+        self.max_in_flight = max(1, max_in_flight)
+        self.timeout = timeout
+        self.rate_limiter = rate_limiter
+        self.rtt_estimator = rtt_estimator
+
+        limit = raise_open_file_limit(self.max_in_flight + FD_HEADROOM)
+        if limit is not None and limit < self.max_in_flight + FD_HEADROOM:
+            allowed = max(1, limit - min(FD_HEADROOM, limit // 2))
+            if allowed < self.max_in_flight:
+                print(f"Open file limit is {limit}, lowering max_in_flight from {self.max_in_flight} to {allowed}")
+                self.max_in_flight = allowed
+
+    async def probe(self, ip: int, address: str, port: int) -> bool:
+        if self.rate_limiter is not None:
+            await self.rate_limiter.acquire_async()
+
+        timeout = self.timeout
+        if self.rtt_estimator is not None:
+            timeout = self.rtt_estimator.timeout(ip)
+
+        loop = asyncio.get_running_loop()
+        sock = None
+        started = time.monotonic()
+        try:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            sock.setblocking(False)
+            await asyncio.wait_for(loop.sock_connect(sock, (address, port)), timeout)
+            self._observe(ip, started)
+            return True
+        except ConnectionRefusedError:
+            self._observe(ip, started)
+            return False
+        except (OSError, asyncio.TimeoutError):
+            return False
+        finally:
+            if sock is not None:
+                sock.close()
+
+    def _observe(self, ip: int, started: float):
+        if self.rtt_estimator is not None:
+            self.rtt_estimator.observe(ip, time.monotonic() - started)
+
+    async def run(self, hosts: Iterable[int], emit: Callable[[Tuple[int, List[int]]], None],
+                  stop: threading.Event = None):
+        """
+        Scan hosts (IPv4 addresses as integers) as they are produced by `hosts`,
+        which may block (e.g. a queue fed by host discovery). `emit` may block
+        too, to apply back-pressure. Both run on helper threads so the event
+        loop keeps serving connects. Once `stop` is set no new host is taken
+        and queued connects are skipped.
+        """
+        stopped = stop.is_set if stop is not None else lambda: False
+        loop = asyncio.get_running_loop()
+        hosts = iter(hosts)
+        pairs = asyncio.Queue(maxsize=self.max_in_flight * 2)
+        remaining = {}
+        open_ports = {}
+
+        with ThreadPoolExecutor(max_workers=1) as feeder, ThreadPoolExecutor(max_workers=1) as reporter:
+            async def feed():
+                while not stopped():
+                    ip = await loop.run_in_executor(feeder, next, hosts, None)
+                    if ip is None:
+                        break
+                    ports = self.ports_for.get(ip, self.ports)
+                    if not ports:
+                        await loop.run_in_executor(reporter, emit, (ip, []))
+                        continue
+                    remaining[ip] = len(ports)
+                    open_ports[ip] = []
+                    address = int_to_ip(ip)
+                    for port in ports:
+                        await pairs.put((ip, address, port))
+                for _ in range(self.max_in_flight):
+                    await pairs.put(None)
+
+            async def worker():
+                while True:
+                    item = await pairs.get()
+                    if item is None:
+                        return
+
+                    ip, address, port = item
+                    if not stopped() and await self.probe(ip, address, port):
+                        open_ports[ip].append(port)
+
+                    remaining[ip] -= 1
+                    if remaining[ip] == 0:
+                        del remaining[ip]
+                        await loop.run_in_executor(reporter, emit, (ip, sorted(open_ports.pop(ip))))
+
+            await asyncio.gather(feed(), *(worker() for _ in range(self.max_in_flight)))
@@ -0,0 +1,79 @@
+from __future__ import annotations
+from concurrent.futures import Future
+from typing import Callable, Dict, Hashable
+import threading
+
+
+class QueryCache:
+    """
+    Read-through cache of query results, keyed by query name and parameters.
+
+    Every entry belongs to the current generation and `invalidate()`, called
+    once a write has committed, starts a new one. A result loaded while a write
+    commits is returned to its callers but not cached, so the cache never
+    serves data older than the last invalidation. Concurrent misses on the same
+    key share one load. Cached values are shared between callers and must not
+    be modified.
+    """
+
+    def __init__(self, max_entries: int = 1024):
+        self.max_entries = max_entries
+
+        self._entries: Dict[Hashable, object] = {}
+        self._in_flight: Dict[Hashable, Future] = {}
+        self._generation = 0
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, key: Hashable, load: Callable[[], object]):
+        with self._lock:
+            if key in self._entries:
+                self.hits += 1
+                return self._entries[key]
+
+            self.misses += 1
+            future = self._in_flight.get(key)
+            owner = future is None
+            if owner:
+                future = Future()
+                self._in_flight[key] = future
+                generation = self._generation
+
+        if not owner:
+            return future.result()
+
+        try:
+            value = load()
+        except BaseException as e:
+            with self._lock:
+                self._in_flight.pop(key, None)
+            future.set_exception(e)
+            raise
+
+        with self._lock:
+            if self._in_flight.get(key) is future:
+                del self._in_flight[key]
+            if generation == self._generation and len(self._entries) < self.max_entries:
+                self._entries[key] = value
+        future.set_result(value)
+        return value
+
+    def invalidate(self):
+        """Drop every entry, loads still running are not cached either"""
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+            self._in_flight.clear()
+            self.invalidations += 1
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "cached": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "invalidations": self.invalidations
+            }
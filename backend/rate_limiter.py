@@ -0,0 +1,69 @@
+from __future__ import annotations
+import asyncio
+import threading
+import time
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket shared by every probe type of a scan.
+
+    Tokens refill at `rate` per second up to `burst`. A rate of 0 disables
+    limiting. `acquire` and `acquire_async` reserve a token and wait until it is
+    due, so concurrent callers are served in order without busy waiting;
+    `try_acquire` and `delay` let a single-threaded event loop pace itself.
+    """
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    @property
+    def unlimited(self) -> bool:
+        return self.rate <= 0
+
+    def _refill(self, now: float):
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def _reserve(self) -> float:
+        """Take one token, possibly going into debt. Returns the seconds to wait before using it."""
+        with self._lock:
+            self._refill(time.monotonic())
+            self._tokens -= 1
+            return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+    def try_acquire(self) -> bool:
+        if self.unlimited:
+            return True
+        with self._lock:
+            self._refill(time.monotonic())
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return True
+            return False
+
+    def delay(self) -> float:
+        """Seconds until the next token is available"""
+        if self.unlimited:
+            return 0.0
+        with self._lock:
+            self._refill(time.monotonic())
+            return 0.0 if self._tokens >= 1 else (1 - self._tokens) / self.rate
+
+    def acquire(self):
+        if self.unlimited:
+            return
+        wait = self._reserve()
+        if wait > 0:
+            time.sleep(wait)
+
+    async def acquire_async(self):
+        if self.unlimited:
+            return
+        wait = self._reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
@@ -0,0 +1,170 @@
+from __future__ import annotations
+from array import array
+from bisect import bisect_left
+from collections.abc import Mapping
+from typing import Dict, Iterator, List, Optional, Tuple
+import ipaddress
+
+from targets import host_range, int_to_ip, ip_to_int
+
+UNKNOWN_HOSTNAME = "Unknown"
+
+
+def iter_set_bits(bitmap: bytes, first: int) -> Iterator[int]:
+    """Hosts whose bit is set, bit i (byte i // 8, LSB first) standing for host first + i"""
+    for index, byte in enumerate(bitmap):
+        while byte:
+            bit = byte & -byte
+            yield first + (index << 3) + bit.bit_length() - 1
+            byte ^= bit
+
+
+def bit_is_set(bitmap: bytes, offset: int) -> bool:
+    return 0 <= offset < len(bitmap) * 8 and bool(bitmap[offset >> 3] & (1 << (offset & 7)))
+
+
+class ScanResults(Mapping):
+    """
+    Compact container for the results of one scan over a network range.
+
+    Which hosts were probed and which of them are online are two bitmaps over
+    the range, so an offline host costs two bits. Hosts with details (open
+    ports, hostname) are stored in parallel arrays: the IP as an integer, an
+    offset into one packed array of ports and an index into an interned
+    hostname table.
+
+    It is also a read-only mapping of dotted-quad IP to
+    {"status", "ports", "hostname"} over every probed host of the range, which
+    is the shape the database layer and the Socket.IO clients expect.
+    """
+
+    def __init__(self, network: ipaddress.IPv4Network):
+        self.network = network
+        self.first, self.last = host_range(network)
+        self.size = self.last - self.first + 1
+        self._probed = bytearray((self.size + 7) // 8)
+        self._online = bytearray((self.size + 7) // 8)
+        self.probed_count = 0
+        self.online_count = 0
+        self.hosts_with_ports = 0
+
+        self._hosts = array("I")
+        self._port_offsets = array("I", [0])
+        self._ports = array("H")
+        self._hostname_ids = array("I")
+        self._hostnames = [UNKNOWN_HOSTNAME]
+        self._hostname_index = {UNKNOWN_HOSTNAME: 0}
+
+        self._sorted_hosts: Optional[array] = None
+        self._sorted_rows: Optional[array] = None
+
+    def _offset(self, ip: int) -> int:
+        if not self.first <= ip <= self.last:
+            raise KeyError(int_to_ip(ip))
+        return ip - self.first
+
+    def set_online(self, ip: int, online: bool = True):
+        """Record the ping result of a host, which also marks it as probed"""
+        offset = self._offset(ip)
+        mask = 1 << (offset & 7)
+        if not self._probed[offset >> 3] & mask:
+            self._probed[offset >> 3] |= mask
+            self.probed_count += 1
+
+        was_online = bool(self._online[offset >> 3] & mask)
+        if online and not was_online:
+            self._online[offset >> 3] |= mask
+            self.online_count += 1
+        elif not online and was_online:
+            self._online[offset >> 3] &= ~mask
+            self.online_count -= 1
+
+    def is_online(self, ip: int) -> bool:
+        offset = self._offset(ip)
+        return bool(self._online[offset >> 3] & (1 << (offset & 7)))
+
+    def is_probed(self, ip: int) -> bool:
+        offset = self._offset(ip)
+        return bool(self._probed[offset >> 3] & (1 << (offset & 7)))
+
+    def set_host(self, ip: int, ports: List[int], hostname: str = UNKNOWN_HOSTNAME):
+        """Record ports and hostname of an online host. Call at most once per host."""
+        self.set_online(ip)
+
+        hostname = hostname or UNKNOWN_HOSTNAME
+        hostname_id = self._hostname_index.get(hostname)
+        if hostname_id is None:
+            hostname_id = len(self._hostnames)
+            self._hostnames.append(hostname)
+            self._hostname_index[hostname] = hostname_id
+
+        self._hosts.append(ip)
+        self._ports.extend(sorted(ports))
+        self._port_offsets.append(len(self._ports))
+        self._hostname_ids.append(hostname_id)
+        if ports:
+            self.hosts_with_ports += 1
+        self._sorted_hosts = None
+
+    def _row(self, ip: int) -> Optional[int]:
+        if self._sorted_hosts is None:
+            rows = sorted(range(len(self._hosts)), key=self._hosts.__getitem__)
+            self._sorted_rows = array("I", rows)
+            self._sorted_hosts = array("I", (self._hosts[row] for row in rows))
+
+        position = bisect_left(self._sorted_hosts, ip)
+        if position < len(self._sorted_hosts) and self._sorted_hosts[position] == ip:
+            return self._sorted_rows[position]
+        return None
+
+    def host(self, ip: int) -> Tuple[bool, List[int], str]:
+        """(is_online, open_ports, hostname) of a host given as integer"""
+        online = self.is_online(ip)
+        row = self._row(ip) if online else None
+        if row is None:
+            return online, [], UNKNOWN_HOSTNAME
+        ports = self._ports[self._port_offsets[row]:self._port_offsets[row + 1]].tolist()
+        return True, ports, self._hostnames[self._hostname_ids[row]]
+
+    def online_hosts(self) -> Iterator[int]:
+        """Online hosts as integers, in address order"""
+        return iter_set_bits(self._online, self.first)
+
+    def probed_hosts(self) -> Iterator[int]:
+        """Probed hosts as integers, in address order"""
+        return iter_set_bits(self._probed, self.first)
+
+    def bitmaps(self) -> Tuple[bytes, bytes]:
+        """Copies of the probed and online bitmaps, in the layout iter_set_bits reads"""
+        return bytes(self._probed), bytes(self._online)
+
+    @staticmethod
+    def _entry(online: bool, ports: List[int], hostname: str) -> Dict:
+        return {"status": "online" if online else "offline", "ports": ports, "hostname": hostname}
+
+    def __getitem__(self, ip: str) -> Dict:
+        if ip not in self:
+            raise KeyError(ip)
+        return self._entry(*self.host(ip_to_int(ip)))
+
+    def __iter__(self) -> Iterator[str]:
+        return (int_to_ip(ip) for ip in self.probed_hosts())
+
+    def __len__(self) -> int:
+        return self.probed_count
+
+    def __contains__(self, ip) -> bool:
+        try:
+            return self.is_probed(ip_to_int(ip))
+        except (OSError, TypeError, KeyError):
+            return False
+
+    def items(self) -> Iterator[Tuple[str, Dict]]:
+        for ip in self.probed_hosts():
+            yield int_to_ip(ip), self._entry(*self.host(ip))
+
+    def values(self) -> Iterator[Dict]:
+        return (entry for _, entry in self.items())
+
+    def to_dict(self) -> Dict[str, Dict]:
+        return dict(self.items())
@@ -0,0 +1,63 @@
+from __future__ import annotations
+from typing import Dict, Optional
+import threading
+
+ALPHA = 1 / 8
+BETA = 1 / 4
+
+
+class _Estimate:
+    __slots__ = ("srtt", "rttvar")
+
+    def __init__(self, rtt: float):
+        self.srtt = rtt
+        self.rttvar = rtt / 2
+
+    def update(self, rtt: float):
+        self.rttvar = (1 - BETA) * self.rttvar + BETA * abs(self.srtt - rtt)
+        self.srtt = (1 - ALPHA) * self.srtt + ALPHA * rtt
+
+    def rto(self) -> float:
+        return self.srtt + 4 * self.rttvar
+
+
+class RttEstimator:
+    """
+    Per-host and per-subnet round trip time estimates, smoothed like TCP's
+    retransmission timeout (RFC 6298). Hosts are IPv4 addresses as integers.
+
+    timeout() returns srtt + 4 * rttvar for the host, falls back to its subnet
+    and then to `initial_timeout`, clamped to [min_timeout, max_timeout].
+    """
+
+    def __init__(self, initial_timeout: float = 1.0, min_timeout: float = 0.1,
+                 max_timeout: float = 3.0, subnet_prefix: int = 24):
+        self.initial_timeout = initial_timeout
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self.subnet_shift = 32 - subnet_prefix
+        self._hosts: Dict[int, _Estimate] = {}
+        self._subnets: Dict[int, _Estimate] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, ip: int, rtt: Optional[float]):
+        if rtt is None or rtt < 0:
+            return
+        with self._lock:
+            for table, key in ((self._hosts, ip), (self._subnets, ip >> self.subnet_shift)):
+                estimate = table.get(key)
+                if estimate is None:
+                    table[key] = _Estimate(rtt)
+                else:
+                    estimate.update(rtt)
+
+    def forget(self, ip: int):
+        """Drop the host estimate once no more probes will be sent to it"""
+        with self._lock:
+            self._hosts.pop(ip, None)
+
+    def timeout(self, ip: int, multiplier: float = 1.0) -> float:
+        with self._lock:
+            estimate = self._hosts.get(ip) or self._subnets.get(ip >> self.subnet_shift)
+            value = estimate.rto() * multiplier if estimate is not None else self.initial_timeout
+        return min(self.max_timeout, max(self.min_timeout, value))
@@ -0,0 +1,296 @@
+from __future__ import annotations
+from bisect import bisect_right
+from collections import deque
+from typing import Dict, Iterator, List, Optional
+import ipaddress
+import itertools
+import json
+import queue
+import socketserver
+import threading
+import time
+import uuid
+
+from targets import host_range
+
+
+def split_shards(network: ipaddress.IPv4Network, shard_prefix: int) -> List[Dict]:
+    """
+    Split a network into CIDR shards of at most /shard_prefix. Each shard keeps
+    the host range of the parent network, so the parent's network and broadcast
+    addresses are still excluded but the shard's own are not.
+    """
+    first, last = host_range(network)
+    if network.prefixlen >= shard_prefix:
+        subnets = [network]
+    else:
+        subnets = network.subnets(new_prefix=shard_prefix)
+
+    shards = []
+    for subnet in subnets:
+        start = max(int(subnet.network_address), first)
+        end = min(int(subnet.broadcast_address), last)
+        if start <= end:
+            shards.append({"cidr": str(subnet), "first": start, "last": end})
+    return shards
+
+
+class _Job:
+    def __init__(self, job_id: int, network: ipaddress.IPv4Network, ping_timeout: int, shard_prefix: int,
+                 priority: List[int] = None):
+        self.job_id = job_id
+        self.network = network
+        self.ping_timeout = ping_timeout
+        self.shards = split_shards(network, shard_prefix)
+        self._assign_priority(priority or [])
+        # Shards with the most recently online hosts are leased first
+        self.pending = deque(sorted(range(len(self.shards)), key=lambda index: -len(self.shards[index]["priority"])))
+        self.leases = {}
+        self.done = set()
+        self.reported = {}
+        self.events = queue.Queue()
+
+    def _assign_priority(self, priority: List[int]):
+        """Hand every shard the recently online hosts it contains, keeping their order"""
+        starts = [shard["first"] for shard in self.shards]
+        for shard in self.shards:
+            shard["priority"] = []
+        for ip in priority:
+            index = bisect_right(starts, ip) - 1
+            if index >= 0 and ip <= self.shards[index]["last"]:
+                self.shards[index]["priority"].append(ip)
+
+    def finished(self) -> bool:
+        return len(self.done) == len(self.shards)
+
+
+class _WorkerHandler(socketserver.StreamRequestHandler):
+    """One connected worker. Speaks newline-delimited JSON."""
+
+    def send(self, message: Dict):
+        self.wfile.write(json.dumps(message).encode() + b"\n")
+        self.wfile.flush()
+
+    def handle(self):
+        coordinator = self.server.coordinator
+        worker = None
+        try:
+            for line in self.rfile:
+                message = json.loads(line)
+                kind = message.get("type")
+
+                if worker is None:
+                    if kind != "hello" or message.get("token", "") != coordinator.token:
+                        self.send({"type": "error", "error": "Authentication failed"})
+                        return
+                    worker = f"{message.get('worker', 'worker')}@{self.client_address[0]}:{self.client_address[1]}"
+                    coordinator.worker_connected(worker)
+                    self.send({"type": "welcome"})
+                elif kind == "lease":
+                    self.send(coordinator.lease(worker))
+                elif kind == "events":
+                    coordinator.receive_events(message)
+                elif kind == "done":
+                    coordinator.complete(message)
+        except (OSError, ValueError) as e:
+            print(f"Scan worker {worker or self.client_address} connection error: {e}")
+        finally:
+            if worker is not None:
+                coordinator.worker_disconnected(worker)
+
+
+class _CoordinatorServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class ScanCoordinator:
+    """
+    Coordinator for distributed scans.
+
+    Remote workers (scan_worker.py) connect over TCP and lease CIDR shards of the
+    current scan job. Their streamed events are merged and yielded by `run` in
+    the same shape as ScanPipeline.run, so the caller stores one scan as usual.
+    A lease is renewed by every message for its shard; a shard whose lease
+    expires or whose worker disconnects is handed to the next worker.
+    Listening beyond loopback requires a shared token, since any worker can
+    report hosts into the stored scan.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 5051, shard_prefix: int = 24,
+                 lease_seconds: float = 30.0, worker_wait: float = 60.0, token: str = ""):
+        self.host = host
+        self.port = port
+        self.shard_prefix = shard_prefix
+        self.lease_seconds = lease_seconds
+        self.worker_wait = worker_wait
+        self.token = token
+
+        self._lock = threading.Lock()
+        self._job_lock = threading.Lock()
+        self._job: Optional[_Job] = None
+        self._job_ids = itertools.count(1)
+        self._workers = set()
+        self._server = None
+
+    def _is_loopback(self) -> bool:
+        if self.host == "localhost":
+            return True
+        try:
+            return ipaddress.ip_address(self.host).is_loopback
+        except ValueError:
+            return False
+
+    def start(self):
+        if not self.token and not self._is_loopback():
+            raise ValueError(f"Refusing to listen on {self.host} without a coordinator token, "
+                             f"set [coordinator] token or use a loopback host")
+        with self._lock:
+            if self._server is not None:
+                return
+            self._server = _CoordinatorServer((self.host, self.port), _WorkerHandler)
+            self._server.coordinator = self
+            threading.Thread(target=self._server.serve_forever, daemon=True).start()
+            print(f"Scan coordinator listening on {self.host}:{self.port}")
+
+    def stop(self):
+        with self._lock:
+            if self._server is not None:
+                self._server.shutdown()
+                self._server.server_close()
+                self._server = None
+
+    def worker_connected(self, worker: str):
+        with self._lock:
+            self._workers.add(worker)
+        print(f"Scan worker connected: {worker}")
+
+    def worker_disconnected(self, worker: str):
+        with self._lock:
+            self._workers.discard(worker)
+            job = self._job
+            if job is not None:
+                for index, lease in list(job.leases.items()):
+                    if lease["worker"] == worker:
+                        self._requeue(job, index)
+        print(f"Scan worker disconnected: {worker}")
+
+    def _requeue(self, job: _Job, index: int):
+        del job.leases[index]
+        job.pending.appendleft(index)
+        print(f"Shard {job.shards[index]['cidr']} of job {job.job_id} requeued")
+
+    def lease(self, worker: str) -> Dict:
+        with self._lock:
+            job = self._job
+            if job is None or not job.pending:
+                return {"type": "idle", "retry": 1.0}
+
+            index = job.pending.popleft()
+            lease_id = uuid.uuid4().hex
+            job.leases[index] = {"lease": lease_id, "worker": worker,
+                                 "expires": time.monotonic() + self.lease_seconds}
+            job.reported.setdefault(index, {})
+            shard = job.shards[index]
+            return {"type": "shard", "job": job.job_id, "shard": index, "lease": lease_id,
+                    "cidr": shard["cidr"], "first": shard["first"], "last": shard["last"],
+                    "priority": shard["priority"], "ping_timeout": job.ping_timeout, "lease_seconds": self.lease_seconds}
+
+    def _current_lease(self, message: Dict) -> Optional[_Job]:
+        job = self._job
+        if job is None or message.get("job") != job.job_id:
+            return None
+        lease = job.leases.get(message.get("shard"))
+        if lease is None or lease["lease"] != message.get("lease"):
+            return None
+        lease["expires"] = time.monotonic() + self.lease_seconds
+        return job
+
+    def receive_events(self, message: Dict):
+        with self._lock:
+            job = self._current_lease(message)
+            if job is None:
+                return
+
+            reported = job.reported[message["shard"]]
+            events = [tuple(event) for event in message.get("events", [])
+                      if self._accept(reported, event)]
+
+        if events:
+            job.events.put(events)
+
+    @staticmethod
+    def _accept(reported: Dict[int, List[bool]], event: List) -> bool:
+        """
+        A reassigned shard is rescanned from the start, so a host can be reported
+        twice with different results. Per IP (-> [online, host event sent]) the
+        first complete result wins: an offline ping, or an online ping followed
+        by its host event. Only an online ping still waiting for its host event
+        can be overturned by an offline ping of the rescan, which record_event
+        turns into the one offline row of the host.
+        """
+        ip = event[1]
+        state = reported.get(ip)
+        if event[0] == "ping":
+            online = bool(event[2])
+            if state is None:
+                reported[ip] = [online, False]
+                return True
+            if state[0] and not state[1] and not online:
+                state[0] = False
+                return True
+            return False
+
+        if state is None or not state[0] or state[1]:
+            return False
+        state[1] = True
+        return True
+
+    def complete(self, message: Dict):
+        with self._lock:
+            job = self._current_lease(message)
+            if job is None:
+                return
+            index = message["shard"]
+            del job.leases[index]
+            job.reported.pop(index, None)
+            job.done.add(index)
+
+    def _expire_leases(self, job: _Job):
+        now = time.monotonic()
+        with self._lock:
+            for index, lease in list(job.leases.items()):
+                if lease["expires"] < now:
+                    print(f"Lease of {lease['worker']} on shard {job.shards[index]['cidr']} expired")
+                    self._requeue(job, index)
+
+    def run(self, network: ipaddress.IPv4Network, ping_timeout: int = 2,
+            priority: List[int] = None) -> Iterator[tuple]:
+        """Scan the network on the connected workers, `priority` hosts (as integers) first"""
+        self.start()
+
+        with self._job_lock:
+            job = _Job(next(self._job_ids), network, ping_timeout, self.shard_prefix, priority)
+            with self._lock:
+                self._job = job
+            print(f"Distributed scan job {job.job_id}: {len(job.shards)} shards of {network}")
+
+            idle_since = time.monotonic()
+            try:
+                while not job.finished() or not job.events.empty():
+                    try:
+                        yield from job.events.get(timeout=1.0)
+                    except queue.Empty:
+                        pass
+
+                    self._expire_leases(job)
+
+                    with self._lock:
+                        working = bool(self._workers)
+                    if working:
+                        idle_since = time.monotonic()
+                    elif time.monotonic() - idle_since > self.worker_wait:
+                        raise Exception("No scan workers connected to the coordinator")
+            finally:
+                with self._lock:
+                    self._job = None
@@ -0,0 +1,130 @@
+from __future__ import annotations
+from typing import Callable, Iterable, Iterator, Tuple
+import asyncio
+import queue
+import threading
+
+from port_scanner import AsyncPortScanner
+from rtt_estimator import RttEstimator
+
+_DONE = object()
+# seconds between checks of the stop flag while a queue is full or empty
+_POLL_INTERVAL = 0.1
+
+
+class ScanPipeline:
+    """
+    Streaming discovery -> port scan -> hostname resolution pipeline.
+
+    Each stage runs on its own thread(s) and hands hosts to the next stage
+    through a bounded queue, so a host is port scanned as soon as it answers
+    instead of after the whole ping sweep. Hosts are IPv4 addresses as
+    integers. `run` yields events as they happen:
+
+        ("ping", ip, is_online, rtt)
+        ("host", ip, open_ports, hostname)
+    """
+
+    def __init__(self, ping_sweep: Callable[[Iterable[int]], Iterable[Tuple[int, bool, float]]],
+                 port_scanner: AsyncPortScanner, resolve: Callable[[int], str],
+                 resolver_threads: int = 16, queue_size: int = 1024,
+                 rtt_estimator: RttEstimator = None):
+        self.ping_sweep = ping_sweep
+        self.rtt_estimator = rtt_estimator
+        self.port_scanner = port_scanner
+        self.resolve = resolve
+        self.resolver_threads = max(1, resolver_threads)
+        self.queue_size = queue_size
+
+    def run(self, targets: Iterable[int]) -> Iterator[tuple]:
+        """
+        Closing the generator, or an error in the consumer or a stage, stops
+        every stage: blocked queue operations give up once `stop` is set.
+        """
+        events = queue.Queue(maxsize=self.queue_size)
+        live = queue.Queue(maxsize=self.queue_size)
+        scanned = queue.Queue(maxsize=self.queue_size)
+        resolvers_left = [self.resolver_threads]
+        lock = threading.Lock()
+        stop = threading.Event()
+
+        def put(target: queue.Queue, item) -> bool:
+            while not stop.is_set():
+                try:
+                    target.put(item, timeout=_POLL_INTERVAL)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+
+        def get(source: queue.Queue):
+            while not stop.is_set():
+                try:
+                    return source.get(timeout=_POLL_INTERVAL)
+                except queue.Empty:
+                    pass
+            return _DONE
+
+        def discover():
+            sweep = self.ping_sweep(targets)
+            try:
+                for ip, is_online, rtt in sweep:
+                    if not put(events, ("ping", ip, is_online, rtt)):
+                        break
+                    if is_online:
+                        if self.rtt_estimator is not None:
+                            self.rtt_estimator.observe(ip, rtt)
+                        if not put(live, ip):
+                            break
+            except Exception as e:
+                put(events, e)
+            finally:
+                close = getattr(sweep, "close", None)
+                if close is not None:
+                    close()
+                put(live, _DONE)
+
+        def port_scan():
+            try:
+                asyncio.run(self.port_scanner.run(iter(lambda: get(live), _DONE),
+                                                  lambda item: put(scanned, item), stop))
+            except Exception as e:
+                put(events, e)
+            finally:
+                for _ in range(self.resolver_threads):
+                    put(scanned, _DONE)
+
+        def resolve():
+            try:
+                for ip, open_ports in iter(lambda: get(scanned), _DONE):
+                    hostname = self.resolve(ip)
+                    if self.rtt_estimator is not None:
+                        self.rtt_estimator.forget(ip)
+                    if not put(events, ("host", ip, open_ports, hostname)):
+                        break
+            except Exception as e:
+                put(events, e)
+            finally:
+                with lock:
+                    resolvers_left[0] -= 1
+                    if resolvers_left[0] == 0:
+                        put(events, _DONE)
+
+        stages = [threading.Thread(target=discover, daemon=True),
+                  threading.Thread(target=port_scan, daemon=True)]
+        stages += [threading.Thread(target=resolve, daemon=True) for _ in range(self.resolver_threads)]
+        for stage in stages:
+            stage.start()
+
+        try:
+            while True:
+                event = events.get()
+                if event is _DONE:
+                    break
+                if isinstance(event, Exception):
+                    raise event
+                yield event
+        finally:
+            stop.set()
+            for stage in stages:
+                stage.join()
@@ -0,0 +1,171 @@
+"""
+Remote scan worker for the distributed scan mode.
+
+Connects to the backend's scan coordinator over TCP, leases CIDR shards and
+scans them with the regular NetworkScan engine, streaming events back.
+
+Usage: python scan_worker.py [--coordinator HOST:PORT] [--processes N] [--name NAME] [--token TOKEN]
+Several local worker processes can be started with --processes for testing.
+"""
+from __future__ import annotations
+from contextlib import closing
+from typing import Dict
+import argparse
+import json
+import multiprocessing
+import queue
+import socket
+import threading
+import time
+
+from parser import Parser
+
+_BATCH_SIZE = 256
+# events buffered between the scan thread and the connection before the scan waits
+_QUEUE_SIZE = 16 * _BATCH_SIZE
+_DONE = object()
+
+
+class ScanWorker:
+    def __init__(self, host: str, port: int, name: str, token: str = ""):
+        self.host = host
+        self.port = port
+        self.name = name
+        self.token = token
+        self.scanner = None
+
+    def send(self, stream, message: Dict):
+        stream.write(json.dumps(message).encode() + b"\n")
+        stream.flush()
+
+    def receive(self, stream) -> Dict:
+        line = stream.readline()
+        if not line:
+            raise ConnectionError("Coordinator closed the connection")
+        return json.loads(line)
+
+    def run_forever(self):
+        while True:
+            try:
+                with socket.create_connection((self.host, self.port), timeout=10) as sock:
+                    sock.settimeout(None)
+                    stream = sock.makefile("rwb")
+                    self.session(stream)
+            except Exception as e:
+                print(f"[{self.name}] Coordinator connection failed: {e}, retrying in 5s")
+                time.sleep(5)
+
+    def session(self, stream):
+        self.send(stream, {"type": "hello", "worker": self.name, "token": self.token})
+        reply = self.receive(stream)
+        if reply.get("type") != "welcome":
+            raise ConnectionError(reply.get("error", "Coordinator rejected the worker"))
+        print(f"[{self.name}] Connected to coordinator {self.host}:{self.port}")
+
+        while True:
+            self.send(stream, {"type": "lease"})
+            lease = self.receive(stream)
+            if lease.get("type") == "shard":
+                self.scan_shard(stream, lease)
+            else:
+                time.sleep(lease.get("retry", 1.0))
+
+    def scan_shard(self, stream, lease: Dict):
+        if self.scanner is None:
+            from main import NetworkScan
+            self.scanner = NetworkScan(worker=True)
+
+        print(f"[{self.name}] Scanning shard {lease['cidr']}")
+        header = {"job": lease["job"], "shard": lease["shard"], "lease": lease["lease"]}
+        heartbeat = lease["lease_seconds"] / 3
+        events = queue.Queue(maxsize=_QUEUE_SIZE)
+        stop = threading.Event()
+
+        def put(item) -> bool:
+            while not stop.is_set():
+                try:
+                    events.put(item, timeout=0.5)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+
+        def scan():
+            try:
+                targets = self.scanner.targets_by_priority(lease["first"], lease["last"],
+                                                           lease.get("priority", []))
+                # Closing the pipeline stops its stages, so nothing outlives the lease
+                with closing(self.scanner.scan_hosts(targets, lease["ping_timeout"])) as scan_events:
+                    for event in scan_events:
+                        if not put(event):
+                            break
+            except Exception as e:
+                put(e)
+            finally:
+                put(_DONE)
+
+        scanner = threading.Thread(target=scan, daemon=True)
+        scanner.start()
+        try:
+            batch = []
+            sent_at = time.monotonic()
+            finished = False
+            while not finished:
+                try:
+                    event = events.get(timeout=0.5)
+                    if event is _DONE:
+                        finished = True
+                    elif isinstance(event, Exception):
+                        # Drop the connection so the coordinator hands the shard to another worker
+                        raise ConnectionError(f"Scan of shard {lease['cidr']} failed: {event}")
+                    else:
+                        batch.append(event)
+                except queue.Empty:
+                    pass
+
+                # Every message renews the lease, so an empty batch doubles as a heartbeat
+                if batch and (len(batch) >= _BATCH_SIZE or time.monotonic() - sent_at >= 0.5) \
+                        or time.monotonic() - sent_at >= heartbeat:
+                    self.send(stream, dict(header, type="events", events=batch))
+                    batch = []
+                    sent_at = time.monotonic()
+
+            if batch:
+                self.send(stream, dict(header, type="events", events=batch))
+            self.send(stream, dict(header, type="done"))
+        finally:
+            # A failed send or scan ends the session, stop the scan before leasing again
+            stop.set()
+            scanner.join()
+
+
+def run_worker(host: str, port: int, name: str, token: str):
+    ScanWorker(host, port, name, token).run_forever()
+
+
+if __name__ == "__main__":
+    config = Parser()
+    default_port = config.return_var("coordinator", "port")
+
+    arguments = argparse.ArgumentParser(description="Distributed network scan worker")
+    arguments.add_argument("--coordinator", default=f"127.0.0.1:{default_port}",
+                           help="coordinator address as HOST:PORT")
+    arguments.add_argument("--processes", type=int, default=1, help="number of local worker processes")
+    arguments.add_argument("--name", default=socket.gethostname(), help="worker name shown by the coordinator")
+    arguments.add_argument("--token", default=config.return_var("coordinator", "token"),
+                           help="shared token configured on the coordinator")
+    args = arguments.parse_args()
+
+    host, port = args.coordinator.rsplit(":", 1)
+
+    if args.processes <= 1:
+        run_worker(host, int(port), args.name, args.token)
+    else:
+        workers = [
+            multiprocessing.Process(target=run_worker, args=(host, int(port), f"{args.name}-{index}", args.token))
+            for index in range(args.processes)
+        ]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
@@ -0,0 +1,115 @@
+from __future__ import annotations
+from typing import Iterator, List, Tuple
+import ipaddress
+import multiprocessing
+import os
+import queue
+import time
+
+from rate_limiter import TokenBucket
+from targets import host_range
+
+_BATCH_SIZE = 256
+_BATCH_INTERVAL = 0.1
+
+
+def split_range(first: int, last: int, shards: int) -> List[Tuple[int, int]]:
+    """Split an inclusive integer address range into at most `shards` contiguous ranges"""
+    size = last - first + 1
+    shards = max(1, min(shards, size))
+    step, extra = divmod(size, shards)
+    ranges = []
+    start = first
+    for index in range(shards):
+        end = start + step + (1 if index < extra else 0) - 1
+        ranges.append((start, end))
+        start = end + 1
+    return ranges
+
+
+def scan_shard(first: int, last: int, ping_timeout: int, shards: int, channel, priority: List[int] = None):
+    """
+    Worker process entry point: runs a full NetworkScan pipeline over one address
+    range, `priority` hosts first, and streams its events back to the parent in
+    batches. Puts None when done.
+    """
+    from main import NetworkScan
+
+    try:
+        scanner = NetworkScan(worker=True)
+        scanner.max_in_flight = max(1, scanner.max_in_flight // shards)
+        scanner.threads = max(1, scanner.threads // shards)
+        scanner.rate_limiter = TokenBucket(scanner.rate_limiter.rate / shards,
+                                           max(1, scanner.rate_limiter.burst // shards))
+
+        batch = []
+        flushed_at = time.monotonic()
+        for event in scanner.scan_hosts(scanner.targets_by_priority(first, last, priority or []), ping_timeout):
+            batch.append(event)
+            if len(batch) >= _BATCH_SIZE or time.monotonic() - flushed_at >= _BATCH_INTERVAL:
+                channel.put(batch)
+                batch = []
+                flushed_at = time.monotonic()
+        if batch:
+            channel.put(batch)
+    except Exception as e:
+        channel.put(f"Shard {first}-{last} failed: {e}")
+    finally:
+        channel.put(None)
+
+
+class ShardedScan:
+    """
+    Splits a network range across a pool of worker processes, each running its
+    own discovery and port scan pipeline, and merges their event streams.
+    Yields the same events as ScanPipeline.run.
+    """
+
+    def __init__(self, processes: int = 0):
+        self.processes = processes or os.cpu_count() or 1
+
+    def run(self, network: ipaddress.IPv4Network, ping_timeout: int = 2,
+            priority: List[int] = None) -> Iterator[tuple]:
+        """Scan the network across the worker pool, `priority` hosts (as integers) first"""
+        first, last = host_range(network)
+        shards = split_range(first, last, self.processes)
+
+        context = multiprocessing.get_context("spawn")
+        channel = context.Queue()
+        workers = [
+            context.Process(target=scan_shard,
+                            args=(start, end, ping_timeout, len(shards), channel,
+                                  [ip for ip in priority or [] if start <= ip <= end]),
+                            daemon=True)
+            for start, end in shards
+        ]
+        for worker in workers:
+            worker.start()
+
+        running = len(workers)
+        errors = []
+        try:
+            while running:
+                try:
+                    message = channel.get(timeout=1.0)
+                except queue.Empty:
+                    if not any(worker.is_alive() for worker in workers):
+                        break
+                    continue
+
+                if message is None:
+                    running -= 1
+                elif isinstance(message, str):
+                    errors.append(message)
+                else:
+                    yield from message
+        finally:
+            for worker in workers:
+                worker.join(timeout=5)
+                if worker.is_alive():
+                    worker.terminate()
+
+        if running:
+            errors.append(f"{running} shard worker(s) exited without finishing")
+        if errors:
+            raise Exception("; ".join(errors))
@@ -0,0 +1,58 @@
+from __future__ import annotations
+from typing import Iterable, Iterator, Tuple, Union
+import ipaddress
+import socket
+import struct
+
+_ip_struct = struct.Struct("!I")
+
+
+def ip_to_int(ip: str) -> int:
+    return _ip_struct.unpack(socket.inet_aton(ip))[0]
+
+
+def int_to_ip(value: int) -> str:
+    return socket.inet_ntoa(_ip_struct.pack(value))
+
+
+def parse_network(network_range: Union[str, ipaddress.IPv4Network]) -> ipaddress.IPv4Network:
+    if isinstance(network_range, ipaddress.IPv4Network):
+        return network_range
+    return ipaddress.IPv4Network(network_range, strict=False)
+
+
+def host_range(network: ipaddress.IPv4Network) -> Tuple[int, int]:
+    """First and last usable host address as integers, same rules as IPv4Network.hosts()"""
+    first = int(network.network_address)
+    last = int(network.broadcast_address)
+    if network.prefixlen < 31:
+        first += 1
+        last -= 1
+    return first, last
+
+
+def host_count(network: ipaddress.IPv4Network) -> int:
+    first, last = host_range(network)
+    return last - first + 1
+
+
+def prioritized_targets(first: int, last: int, recent: Iterable[int] = (), radius: int = 0) -> Iterator[int]:
+    """
+    Lazily yields every address of [first, last] once: the recently online hosts
+    first, in the given order, then their neighbours within `radius`, nearest
+    first, then every other address in address order.
+    """
+    recent = [ip for ip in dict.fromkeys(recent) if first <= ip <= last]
+    seen = set(recent)
+    yield from recent
+
+    for distance in range(1, radius + 1):
+        for ip in recent:
+            for neighbour in (ip - distance, ip + distance):
+                if first <= neighbour <= last and neighbour not in seen:
+                    seen.add(neighbour)
+                    yield neighbour
+
+    for ip in range(first, last + 1):
+        if ip not in seen:
+            yield ip